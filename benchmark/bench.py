@@ -0,0 +1,351 @@
+# IMPORTS
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+import cv2
+import numpy as np
+
+# the package is next to this directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# INTERNAL IMPORTS
+import optic.image
+from optic.image import Images
+from optic.camera import Camera, Stereo, SaveParams
+
+# VARIABLES
+LEFT_PATH = os.path.join(ROOT, 'example', 'example_left_30mm')
+RIGHT_PATH = os.path.join(ROOT, 'example', 'example_right_30mm')
+SQUARE_SIZE = 30.0
+BASELINE = os.path.join(ROOT, 'benchmark', 'baseline.json')
+
+# entry points of the package and the modules they must not import
+STARTUP = {'import optic': ('cv2', 'numpy', 'tkinter'),
+           'from optic import App': ('cv2', 'numpy'),
+           'from optic import Camera, Stereo': ('tkinter',),
+           'from optic.cli import main': ('tkinter',)}
+HEAVY = ('cv2', 'numpy', 'tkinter')
+
+########################################################
+# Benchmark:
+# headless run of Images, Camera and Stereo on the example
+# images and scaled-up copies, the time of every stage is
+# measured by wrapping the functions of the pipeline
+# python benchmark/bench.py --out result.json --baseline benchmark/baseline.json
+########################################################
+
+class Stages():
+    '''
+    accumulated wall time per stage
+    a stage with parent is only counted inside the parent,
+    e.g. the detection inside GetChessboard, not inside GetBoardSize
+    '''
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.active = set()
+        self.patched = []
+
+    def Wrap(self, owner, name, stage, parent=None):
+        func = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            if parent is not None and parent not in self.active:
+                return func(*args, **kwargs)
+            self.active.add(stage)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[stage] += time.perf_counter() - start
+                self.active.discard(stage)
+
+        setattr(owner, name, timed)
+        self.patched.append((owner, name, func))
+
+    def Restore(self):
+        for owner, name, func in reversed(self.patched):
+            setattr(owner, name, func)
+        self.patched = []
+
+def Instrument(stages):
+    '''
+    wrap the stages of the pipeline
+    decode, detection and subpix are only split for Workers=1,
+    the worker processes are not instrumented
+    '''
+
+    stages.Wrap(Images, 'SortImageNames', 'listing')
+    stages.Wrap(Images, 'GetBoardSize', 'board_size')
+    stages.Wrap(Images, 'GetChessboard', 'chessboard')
+    stages.Wrap(optic.image, 'Decode', 'decode', parent='chessboard')
+    stages.Wrap(cv2, 'findChessboardCorners', 'detection', parent='chessboard')
+    stages.Wrap(cv2, 'cornerSubPix', 'subpix', parent='chessboard')
+    stages.Wrap(Camera, 'Calibration', 'calibration')
+    stages.Wrap(Camera, 'Errors', 'errors')
+    stages.Wrap(Stereo, 'Calibration', 'stereo')
+    stages.Wrap(Stereo, 'Rectification', 'rectification')
+
+def RunPipeline(left, right, workers, file):
+    '''
+    one stereo calibration, returns (stage times, mean errors, views)
+    '''
+
+    stages = Stages()
+    Instrument(stages)
+    try:
+        start = time.perf_counter()
+        L = Images(left, SQUARE_SIZE, Workers=workers)
+        R = Images(right, SQUARE_SIZE, Workers=workers)
+        CL = Camera(L.ImageData)
+        CR = Camera(R.ImageData)
+        St = Stereo(CL.CameraParams, CR.CameraParams)
+        save = time.perf_counter()
+        SaveParams(file, St.StereoParams)
+        stages.times['save'] = time.perf_counter() - save
+        stages.times['total'] = time.perf_counter() - start
+    finally:
+        stages.Restore()
+
+    Params = St.StereoParams
+    errors = {'left': float(Params['L_MeanError']), 'right': float(Params['R_MeanError']),
+              'stereo': float(Params['MeanError'])}
+    return dict(stages.times), errors, len(Params['ViewIndex']), list(Params['ImageSize'][:2])
+
+########################################################
+# Variants:
+# more views are copies of the example images, larger
+# images are upscaled, both written to a temp directory
+########################################################
+
+def MakeVariant(name, tmp):
+    '''
+    directories of the variant: example, views-xK or scale-xS
+    '''
+
+    if name == 'example':
+        return LEFT_PATH, RIGHT_PATH
+    kind, factor = name.split('-x')
+    factor = float(factor)
+    dirs = []
+    for src, side in ((LEFT_PATH, 'L'), (RIGHT_PATH, 'R')):
+        dst = os.path.join(tmp, name, side)
+        os.makedirs(dst)
+        # same order as Images.SortImageNames
+        paths = [os.path.join(src, n) for n in sorted(os.listdir(src), key=lambda n: (len(n), n))]
+        if kind == 'views':
+            # same order on both sides, so the stereo views pair
+            for k in range(int(factor)):
+                for i, path in enumerate(paths):
+                    shutil.copyfile(path, os.path.join(dst, 'Im_{}_{}.png'.format(side, k*len(paths)+i+1)))
+        elif kind == 'scale':
+            for i, path in enumerate(paths):
+                img = cv2.imread(path)
+                img = cv2.resize(img, (0,0), fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
+                cv2.imwrite(os.path.join(dst, 'Im_{}_{}.png'.format(side, i+1)), img)
+        else:
+            raise ValueError('unknown variant {}'.format(name))
+        dirs.append(dst)
+    return tuple(dirs)
+
+def RunVariant(name, tmp, workers, repeat):
+    '''
+    best time of every stage over the repetitions
+    '''
+
+    left, right = MakeVariant(name, tmp)
+    file = os.path.join(tmp, name+'.npz')
+    best = {}
+    for _ in range(repeat):
+        times, errors, views, size = RunPipeline(left, right, workers, file)
+        for stage, t in times.items():
+            best[stage] = min(t, best.get(stage, np.inf))
+    return {'views': views, 'image_size': size, 'mean_error': errors, 'stages': best}
+
+########################################################
+# Start-up:
+# import time of the entry points in a fresh interpreter,
+# measured with python -X importtime
+########################################################
+
+def ImportTime(statement):
+    '''
+    seconds to import the statement (without the interpreter
+    start-up) and the heavy modules it imported
+    '''
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    run = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    seconds = 0.0; started = False; heavy = []
+    for line in run.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[12:].split('|')
+        # the modules of site and encodings are loaded before the statement
+        started = started or name.strip().startswith('optic')
+        if started and not name[1:].startswith(' '):
+            seconds += int(cumulative) * 1e-6
+        if name.strip() in HEAVY:
+            heavy.append(name.strip())
+    return seconds, heavy
+
+def Startup(repeat):
+    '''
+    best import time of every entry point
+    '''
+
+    result = {}
+    for statement in STARTUP:
+        times = []
+        for _ in range(repeat):
+            seconds, heavy = ImportTime(statement)
+            times.append(seconds)
+        result[statement] = {'seconds': min(times), 'modules': heavy}
+    return result
+
+def Forbidden(result):
+    '''
+    entry points importing modules they do not need
+    '''
+
+    problems = []
+    for statement, entry in result.get('startup', {}).items():
+        for module in STARTUP.get(statement, ()):
+            if module in entry['modules']:
+                problems.append('{!r} imports {}'.format(statement, module))
+    return problems
+
+########################################################
+# Regression Gate
+########################################################
+
+def Compare(result, baseline, tolerance=0.25, mintime=0.005, errortol=1e-3):
+    '''
+    list of regressions against the baseline:
+    stages slower by more than tolerance (and mintime seconds)
+    and mean errors drifting by more than errortol pixel
+    '''
+
+    problems = []
+    for name, variant in result['variants'].items():
+        base = baseline.get('variants', {}).get(name)
+        if base is None:
+            continue
+        for stage, t in variant['stages'].items():
+            b = base['stages'].get(stage)
+            if b is not None and t > b*(1+tolerance) and t-b > mintime:
+                problems.append('{} {}: {:.4f} s -> {:.4f} s (+{:.0f}%)'.format(name, stage, b, t, 100*(t/b-1)))
+        for camera, e in variant['mean_error'].items():
+            b = base['mean_error'].get(camera)
+            if b is not None and abs(e-b) > errortol:
+                problems.append('{} {} MeanError: {:.5f} -> {:.5f} px'.format(name, camera, b, e))
+    for statement, entry in result.get('startup', {}).items():
+        b = baseline.get('startup', {}).get(statement)
+        t = entry['seconds']
+        if b is not None and t > b['seconds']*(1+tolerance) and t-b['seconds'] > 4*mintime:
+            problems.append('start-up {!r}: {:.4f} s -> {:.4f} s (+{:.0f}%)'.format(statement, b['seconds'], t, 100*(t/b['seconds']-1)))
+    return problems
+
+def Report(result):
+    '''
+    table of the stage times
+    '''
+
+    stages = []
+    for variant in result['variants'].values():
+        stages += [s for s in variant['stages'] if s not in stages]
+    names = list(result['variants'])
+    lines = ['{:<14}'.format('stage [s]') + ''.join('{:>14}'.format(n) for n in names)]
+    for stage in stages:
+        lines.append('{:<14}'.format(stage) + ''.join(
+            '{:>14.4f}'.format(result['variants'][n]['stages'][stage]) if stage in result['variants'][n]['stages']
+            else '{:>14}'.format('-') for n in names))
+    lines.append('{:<14}'.format('views') + ''.join('{:>14}'.format(result['variants'][n]['views']) for n in names))
+    lines.append('{:<14}'.format('stereo error') + ''.join('{:>14.5f}'.format(result['variants'][n]['mean_error']['stereo']) for n in names))
+    if result.get('startup'):
+        lines.append('')
+        lines.append('{:<34}{:>10}  {}'.format('start-up', 'import [s]', 'heavy modules'))
+        for statement, entry in result['startup'].items():
+            lines.append('{:<34}{:>10.4f}  {}'.format(statement, entry['seconds'], ' '.join(entry['modules']) or '-'))
+    return '\n'.join(lines)
+
+def Parser():
+    parser = argparse.ArgumentParser(description='benchmark of the OPTIC calibration pipeline')
+    parser.add_argument('--variants', nargs='+', default=['example', 'views-x5', 'scale-x2'],
+                        help='example, views-xK (K copies of the views) or scale-xS (images scaled by S)')
+    parser.add_argument('--workers', type=int, default=1, help='processes for the detection, 1 splits decode/detection/subpix')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per variant, the best time is kept')
+    parser.add_argument('--no-startup', dest='startup', action='store_false', help='skip the import time of the entry points')
+    parser.add_argument('--out', help='json-file for the results')
+    parser.add_argument('--baseline', help='json-file of an earlier run to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as new baseline')
+    parser.add_argument('--tolerance', type=float, help='allowed slowdown of a stage (0.25 = 25%%), default of the baseline or 0.25')
+    parser.add_argument('--error-tolerance', type=float, default=1e-3, help='allowed MeanError drift [px]')
+    return parser
+
+def main(argv=None):
+    args = Parser().parse_args(argv)
+    result = {'meta': {'python': platform.python_version(), 'opencv': cv2.__version__, 'numpy': np.__version__,
+                       'platform': platform.platform(), 'cpus': os.cpu_count(), 'workers': args.workers,
+                       'repeat': args.repeat, 'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+              'variants': {}}
+
+    if args.startup:
+        print('measuring start-up ...', file=sys.stderr)
+        result['startup'] = Startup(args.repeat)
+
+    tmp = tempfile.mkdtemp(prefix='optic-bench-')
+    try:
+        for name in args.variants:
+            print('running {} ...'.format(name), file=sys.stderr)
+            result['variants'][name] = RunVariant(name, tmp, args.workers, args.repeat)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(Report(result))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    code = 0
+    problems = Forbidden(result)
+    if problems:
+        print('\nSTART-UP imports heavy modules:')
+        print('\n'.join('  '+p for p in problems))
+        code = 1
+    baseline = args.baseline or (None if args.update_baseline else BASELINE)
+    if baseline and not os.path.exists(baseline):
+        # without baseline the gate would pass silently
+        print('\nNO BASELINE {}, create it with --update-baseline'.format(baseline))
+        code = 1
+    elif baseline:
+        with open(baseline) as f:
+            base = json.load(f)
+        # the committed baseline is from an other machine and
+        # allows more slowdown than a local one
+        tolerance = args.tolerance if args.tolerance is not None else base.get('tolerance', 0.25)
+        problems = Compare(result, base, tolerance, errortol=args.error_tolerance)
+        if problems:
+            print('\nREGRESSIONS against {}:'.format(baseline))
+            print('\n'.join('  '+p for p in problems))
+            code = 1
+        else:
+            print('\nno regressions against {}'.format(baseline))
+    if args.update_baseline:
+        if args.tolerance is not None:
+            result['tolerance'] = args.tolerance
+        with open(BASELINE, 'w') as f:
+            json.dump(result, f, indent=2)
+    return code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,7 @@
 # IMPORTS
 import time
 import tkinter
-from optic import *
+from optic import App  # cv2 is loaded by the App in the background
 
 ########################################################
 # Main Loop
@@ -1,4 +1,5 @@
 # IMPORTS
+import importlib
 #import tkinter
 #import tkinter.filedialog
 #from tkinter.scrolledtext import ScrolledText
@@ -14,7 +15,25 @@ RIGHT_PATH = './example/example_right_30mm/'
 SQUARE_SIZE = 30.0  # in mm
 
 # INTERNAL IMPORTS
-from .graphics import App
-from .image import Images
-from .camera import Camera, Stereo
-from .cal import SingleCamera, StereoCamera
+# module of every public name, imported on first use only:
+# the GUI starts without cv2 and numpy, headless
+# calibration runs without tkinter
+MODULES = {'App': '.graphics',
+           'Params': '.params',
+           'Images': '.image',
+           'Camera': '.camera', 'Stereo': '.camera', 'SaveParams': '.camera', 'LoadParams': '.camera',
+           'SingleCamera': '.cal', 'StereoCamera': '.cal', 'MultiCamera': '.cal',
+           'Rig': '.rig',
+           'Timing': '.timing', 'Profiler': '.timing'}
+
+__all__ = ['LEFT_PATH', 'RIGHT_PATH', 'SQUARE_SIZE'] + list(MODULES)
+
+def __getattr__(name):
+    if name in MODULES:
+        value = getattr(importlib.import_module(MODULES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'optic' has no attribute '{}'".format(name))
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
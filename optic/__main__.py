@@ -0,0 +1,8 @@
+# IMPORTS
+import sys
+
+# INTERNAL IMPORTS
+from .cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# IMPORTS
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+# numpy is imported in Load and Save, so the GUI can read
+# CACHE_PATH before the calibration modules are loaded
+
+# VARIABLES
+CACHE_PATH = '.cache'  # next to the .log directory
+CACHE_VERSION = 3  # increase if the detection or the image size changes
+
+########################################################
+# Class Cache:
+# content addressed storage of detected corners, so
+# unchanged images are not decoded and detected again
+########################################################
+
+class Cache():
+    '''
+    one float32 array per image and detection parameters
+    '''
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    def Hash(self, paths, Workers=1):
+        '''
+        content hash of every file, hashlib releases
+        the GIL so the files are read in threads
+        '''
+
+        with ThreadPoolExecutor(max_workers=max(1, Workers)) as pool:
+            return list(pool.map(FileHash, paths))
+
+    def Key(self, *parts):
+        '''
+        file name for the given hashes and parameters
+        '''
+
+        parts = (CACHE_VERSION,) + parts
+        return hashlib.sha1(repr(parts).encode()).hexdigest() + '.npy'
+
+    def Load(self, key):
+        '''
+        returns (hit, array), an empty array is a stored
+        failed detection
+        '''
+
+        import numpy as np
+        file = os.path.join(self.path, key)
+        # missing, empty or partial files are a miss
+        try:
+            return True, np.load(file)
+        except (OSError, ValueError, EOFError):
+            return False, None
+
+    def Save(self, key, array):
+        '''
+        write the array atomically, so a parallel run
+        never reads half written files
+        '''
+
+        import numpy as np
+        file = os.path.join(self.path, key)
+        tmp = '{}.{}.tmp'.format(file, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, file)
+
+def FileHash(path, blocksize=1<<20):
+    '''
+    sha1 of the file content
+    '''
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
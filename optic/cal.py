@@ -1,52 +1,237 @@
 # IMPORTS
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# INTERNAL IMPORTS
 from .image import Images
 from .camera import Camera, Stereo
+from .rig import Rig
+from .views import Views
+
+########################################################
+# Cancellation:
+# an app may offer a Cancel event (threading.Event) and
+# a Progress(done, total) callback, both are optional
+########################################################
+
+class CalibrationCancelled(Exception):
+    '''
+    the calibration was cancelled by the user
+    '''
+
+def CheckCancel(app):
+    '''
+    stop between the stages if the user cancelled
+    '''
+
+    cancel = getattr(app, 'Cancel', None)
+    if cancel is not None and cancel.is_set():
+        raise CalibrationCancelled()
 
 ########################################################
 # Calibration
 ########################################################
 
-def SingleCamera(app, path, SquareSize):
+def SingleCamera(app, path, SquareSize, MaxError=None, MaxIterations=3, MaxViews=None, Select=None, **kwargs):
     try:
-        Image = Images(path, SquareSize)
+        Image = Images(path, SquareSize, Progress=getattr(app, 'Progress', None), **kwargs)
         ImageData = Image.ImageData
+    except CalibrationCancelled:
+        raise
     except:
         app.scrollarea.print('[ERROR] Error while analyzing the images.')
         return None
     if Image.BoardSizeFehler == True:
         app.scrollarea.print('[ERROR] Error while detecting the Board Size.')
         return None
+    for name in ImageData.get('Failed', []):
+        app.scrollarea.print('Attention, no checkerboard in {}, image skipped.'.format(name), format='warn')
+    if 'Frames' in ImageData:
+        app.scrollarea.print('Checkerboard found in {} of {} distinct video frames.\n'.format(len(ImageData['Imgpoints']), ImageData['Frames']))
+    CheckCancel(app)
     try:
-        Cam = Camera(ImageData, app)
+        # bounded subset of the views, the rest validates the result
+        if MaxViews is not None or Select is not None:
+            ImageData = Views(ImageData, MaxViews, Select=Select).ImageData
+        Cam = Camera(ImageData, app, MaxError=MaxError, MaxIterations=MaxIterations)
         CameraData = Cam.CameraParams
+        app.scrollarea.print(Cam.Timing.Format())
         return CameraData
+    except CalibrationCancelled:
+        raise
     except:
         app.scrollarea.print('[ERROR] Error while Calibration.')
         return None
 
-def StereoCamera(app, pathL, pathR, SquareSize):
-    app.scrollarea.print('CALIBRATION LEFT CAMERA\n')
+def StereoCamera(app, pathL, pathR, SquareSize, Concurrent=True, RectifyMaps=False, Alpha=-1, **kwargs):
+    # the right camera uses the views chosen for the left one,
+    # so a bounded view selection needs the cameras in order
+    if Concurrent and kwargs.get('MaxViews') is None and os.cpu_count() > 1:
+        (LeftData, LeftMessages), (RightData, RightMessages) = Sides(app, (pathL, pathR), SquareSize, **kwargs)
+        
+        app.scrollarea.print('CALIBRATION LEFT CAMERA\n')
+        Replay(app, LeftMessages)
+        app.scrollarea.print('--------------------------------------------------------------------\n')
+        app.scrollarea.print('CALIBRATION RIGHT CAMERA\n')
+        Replay(app, RightMessages)
+        if LeftData == None or RightData == None:
+            return None
     
-    LeftData = SingleCamera(app, pathL, SquareSize)
-    if LeftData == None:
-        return None
-    
-    app.scrollarea.print('--------------------------------------------------------------------\n')
-    app.scrollarea.print('CALIBRATION RIGHT CAMERA\n')
-    
-    RightData = SingleCamera(app, pathR, SquareSize)
-    if RightData == None:
-        return None
+    else:
+        app.scrollarea.print('CALIBRATION LEFT CAMERA\n')
+        
+        LeftData = SingleCamera(app, pathL, SquareSize, **kwargs)
+        if LeftData == None:
+            return None
+        
+        app.scrollarea.print('--------------------------------------------------------------------\n')
+        app.scrollarea.print('CALIBRATION RIGHT CAMERA\n')
+        
+        if kwargs.get('MaxViews') is not None:
+            kwargs['Select'] = LeftData['ViewIndex']
+        RightData = SingleCamera(app, pathR, SquareSize, **kwargs)
+        if RightData == None:
+            return None
     
     app.scrollarea.print('--------------------------------------------------------------------\n')
     app.scrollarea.print('CALIBRATING STEREO CAMERA\n')
+    CheckCancel(app)
 
     try:
-        St = Stereo(LeftData, RightData, app)
+        St = Stereo(LeftData, RightData, app, RectifyMaps=RectifyMaps, Alpha=Alpha)
         StereoData = St.StereoParams
+        app.scrollarea.print(St.Timing.Format())
         return StereoData
     
     except:
         app.scrollarea.print('[ERROR] Error while calibrating the stereo camera.')
         return None
-    
\ No newline at end of file
+
+def MultiCamera(app, paths, SquareSize, Pairs='tree', Reference=0, MinViews=3, Concurrent=True, **kwargs):
+    # a camera of a rig sees the board only in some views,
+    # the k-th image of every folder is the same view
+    kwargs.setdefault('SkipFailed', True)
+    kwargs.pop('MaxViews', None)
+    Cameras = []
+    if Concurrent and os.cpu_count() > 1:
+        # detection once per camera, reused by every pair
+        for k, (data, messages) in enumerate(Sides(app, paths, SquareSize, **kwargs)):
+            if k > 0:
+                app.scrollarea.print('--------------------------------------------------------------------\n')
+            app.scrollarea.print('CALIBRATION CAMERA {}\n'.format(k))
+            Replay(app, messages)
+            Cameras.append(data)
+        if any(data is None for data in Cameras):
+            return None
+
+    else:
+        for k, path in enumerate(paths):
+            if k > 0:
+                app.scrollarea.print('--------------------------------------------------------------------\n')
+            app.scrollarea.print('CALIBRATION CAMERA {}\n'.format(k))
+            data = SingleCamera(app, path, SquareSize, **kwargs)
+            if data == None:
+                return None
+            Cameras.append(data)
+
+    app.scrollarea.print('--------------------------------------------------------------------\n')
+    app.scrollarea.print('CALIBRATING CAMERA RIG\n')
+    CheckCancel(app)
+
+    try:
+        R = Rig(Cameras, app, Pairs=Pairs, Reference=Reference, MinViews=MinViews, Workers=kwargs.get('Workers'))
+        app.scrollarea.print(R.Timing.Format())
+        return R.RigParams
+    except ValueError as e:
+        app.scrollarea.print('[ERROR] {}'.format(e))
+        return None
+    except:
+        app.scrollarea.print('[ERROR] Error while calibrating the camera rig.')
+        return None
+
+########################################################
+# Concurrent Cameras:
+# the cameras of a stereo rig are calibrated in separate
+# processes, the output of every camera is recorded and
+# printed grouped after the join
+########################################################
+
+class RecordConsole():
+    '''
+    console of a worker process, keeps the messages
+    '''
+
+    def __init__(self):
+        self.messages = []
+
+    def print(self, text, pause=1, format='normal'):
+        self.messages.append((text, pause, format))
+
+class SideApp():
+    '''
+    app of one camera in a worker process, progress and
+    cancellation are shared with the main process
+    '''
+
+    def __init__(self, side, events, cancel):
+        self.scrollarea = RecordConsole()
+        self.side = side
+        self.events = events
+        self.Cancel = cancel
+
+    def Progress(self, done, total):
+        self.events.put((self.side, done, total))
+        CheckCancel(self)
+
+# queue and event of the main process, set in every worker
+_SHARED = None
+
+def _InitSide(events, cancel):
+    global _SHARED
+    _SHARED = (events, cancel)
+
+def _CalibrateSide(side, path, SquareSize, kwargs):
+    app = SideApp(side, *_SHARED)
+    return SingleCamera(app, path, SquareSize, **kwargs), app.scrollarea.messages
+
+def Sides(app, paths, SquareSize, **kwargs):
+    '''
+    calibrate one camera per path at the same time
+    the cores are shared between the cameras
+    returns (Params, messages) per path
+    '''
+
+    workers = kwargs.get('Workers') or os.cpu_count()
+    kwargs['Workers'] = max(1, workers // len(paths))
+    events = multiprocessing.Queue()
+    cancel = multiprocessing.Event()
+    progress = getattr(app, 'Progress', None)
+    
+    with ProcessPoolExecutor(max_workers=len(paths), initializer=_InitSide, initargs=(events, cancel)) as pool:
+        futures = [pool.submit(_CalibrateSide, side, path, SquareSize, kwargs) for side, path in enumerate(paths)]
+        try:
+            # forward the progress of all cameras as one
+            done = {}
+            while not all(f.done() for f in futures):
+                try:
+                    side, k, total = events.get(timeout=0.05)
+                except queue.Empty:
+                    CheckCancel(app)
+                    continue
+                done[side] = (k, total)
+                if progress:
+                    progress(sum(d[0] for d in done.values()), sum(d[1] for d in done.values()))
+        except CalibrationCancelled:
+            cancel.set()
+            raise
+        return [f.result() for f in futures]
+
+def Replay(app, messages):
+    '''
+    print the recorded messages of a worker process
+    '''
+
+    for text, pause, format in messages:
+        app.scrollarea.print(text, pause, format=format)
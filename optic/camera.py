@@ -1,7 +1,13 @@
 # IMPORTS
+import json
+import zipfile
 import cv2
 import numpy as np
 
+# INTERNAL IMPORTS
+from .params import Params
+from .timing import Timing, Timed
+
 ########################################################
 # Class Camera:
 # calibrating the camera
@@ -10,47 +16,66 @@ import numpy as np
 
 class Camera():
     
-    def __init__(self, ImageData, app=None):
+    def __init__(self, ImageData, app=None, MaxError=None, MaxIterations=3):
         self.app = app
-        self.CameraParams = {}
+        # views with a higher reprojection error [px] are removed
+        self.MaxError = MaxError
+        self.MaxIterations = MaxIterations
+        # continues the timing of the detection
+        self.Timing = ImageData.get('Timing') or Timing()
+        self.CameraParams = Params()
+        self.CameraParams['Timing'] = self.Timing
         self.CameraParams['Objpoints'] = ImageData['Objpoints']
         self.CameraParams['Imgpoints'] = ImageData['Imgpoints']
         self.CameraParams['ImagePfade'] = ImageData['ImagePfade']
+        self.CameraParams['ViewIndex'] = ImageData.get('ViewIndex', list(range(len(ImageData['Imgpoints']))))
         self.CameraParams['BoardSize'] = ImageData['BoardSize']
         self.CameraParams['ImageSize'] = ImageData['ImageSize']
         self.CameraParams['SquareSize'] = ImageData['SquareSize']
         self.ImageNamesRaw = ImageData['ImageNamesRaw']
+        # views left out by the view selection
+        self.Holdout = ImageData.get('Holdout')
+        # images seen so far, added image sets continue after them
+        self.Images = ImageCount(ImageData)
         
         self.Calibration()
         self.Errors()
+        if self.MaxError is not None:
+            self.Prune()
+        if self.Holdout is not None:
+            self.Validation()
         self.PrintResults()
         
-    def Calibration(self):
+    @Timed('calibration')
+    def Calibration(self, Guess=False):
         '''
         calibration of the camera
+        with Guess the current intrinsics are the starting point
         save all values in CameraParams
         '''
 
-        gray = cv2.cvtColor(cv2.imread(self.CameraParams['ImagePfade'][0]), cv2.COLOR_BGR2GRAY)
-        g = gray.shape[::-1]
+        h,w = self.CameraParams['ImageSize'][:2]
+        g = (w,h)
         
         # HINT: additional settings can be set here
         flags = 0
         # flags |= cv2.CALIB_RATIONAL_MODEL # 6 instead of 3 radial parameters
         
+        # warm start from the previous calibration
+        mtx = None; dist = None
+        if Guess:
+            flags |= cv2.CALIB_USE_INTRINSIC_GUESS
+            mtx = np.array(self.CameraParams['Intrinsic'])
+            dist = np.array(self.CameraParams['Distortion'])
+        
         # calibration
-        (ret, mtx, dist, rvecs, tvecs) = cv2.calibrateCamera(self.CameraParams['Objpoints'], self.CameraParams['Imgpoints'], g, None, None, flags=flags)
+        (ret, mtx, dist, rvecs, tvecs) = cv2.calibrateCamera(self.CameraParams['Objpoints'], self.CameraParams['Imgpoints'], g, mtx, dist, flags=flags)
+        self.Timing.Count('calibration', len(rvecs))
         
         # calculation of the rotationmatrix and transformmatrix
-        Rmtx = []; Tmtx = []; k = 0
-        for r in rvecs: 
-            Rmtx.append(cv2.Rodrigues(r)[0])
-            Tmtx.append(np.vstack((np.hstack((Rmtx[k],tvecs[k])),np.array([0,0,0,1]))))
-            k += 1
+        Rmtx, Tmtx = self.Extrinsics(rvecs, tvecs)
         
         # additional intrinsic matrix with distortion
-        img = cv2.imread(self.CameraParams['ImagePfade'][0],0)
-        h,w = img.shape[:2]
         newmtx, roi = cv2.getOptimalNewCameraMatrix(mtx,dist,(w,h),1,(w,h))
         
         if np.sum(roi) == 0:
@@ -65,49 +90,168 @@ class Camera():
         self.CameraParams['Extrinsics'] = Tmtx
         self.CameraParams['TransVektor'] = tvecs
     
-    def Errors(self):
+    def Extrinsics(self, rvecs, tvecs):
+        '''
+        rotation matrices (N, 3, 3) and transformation matrices
+        (N, 4, 4) of the views
+        '''
+
+        N = len(rvecs)
+        Rmtx = np.zeros((N, 3, 3))
+        for k in range(N):
+            Rmtx[k] = cv2.Rodrigues(np.asarray(rvecs[k], np.float64))[0]
+        Tmtx = np.zeros((N, 4, 4))
+        Tmtx[:, :3, :3] = Rmtx
+        Tmtx[:, :3, 3] = np.asarray(tvecs).reshape((N, 3))
+        Tmtx[:, 3, 3] = 1
+        return Rmtx, Tmtx
+    
+    def AddViews(self, ImageData, Recalibrate=True):
+        '''
+        add newly detected views (ImageData of Images) without
+        detecting the previous views again
+        Recalibrate: calibration of all views, starting from the
+                     previous intrinsics (fast convergence)
+        otherwise:   fixed intrinsics, only the poses and errors
+                     of the new views are calculated
+        '''
+
+        if tuple(ImageData['BoardSize']) != tuple(self.CameraParams['BoardSize']):
+            raise ValueError('Board Size of the new views differs.')
+        
+        first = self.CameraParams.Views()
+        # an image set of Images counts from 0 again, so its views
+        # continue after the images so far (the same for both cameras
+        # of a stereo camera); unique indices (watch mode) are kept
+        index = list(ImageData.get('ViewIndex', range(len(ImageData['Imgpoints']))))
+        offset = self.Images if set(index) & set(self.CameraParams['ViewIndex']) else 0
+        self.Images = max(self.Images, offset + ImageCount(ImageData))
+        added = Params()
+        added['Imgpoints'] = ImageData['Imgpoints']
+        added['ImagePfade'] = list(ImageData['ImagePfade'])
+        added['ViewIndex'] = [offset + v for v in index]
+        self.ImageNamesRaw = list(self.ImageNamesRaw) + list(ImageData['ImageNamesRaw'])
+        
+        if Recalibrate:
+            self.CameraParams.Extend(added)
+            self.Calibration(Guess=True)
+            self.Errors()
+        else:
+            # poses of the new views with the known intrinsics
+            K = self.CameraParams['Intrinsic']
+            D = self.CameraParams['Distortion']
+            objp = self.CameraParams['Objpoints'][0]
+            rvecs = []; tvecs = []
+            for imgp in added['Imgpoints']:
+                _, r, t = cv2.solvePnP(objp, imgp, K, D)
+                rvecs.append(r); tvecs.append(t)
+            added['RotVektor'] = rvecs
+            added['TransVektor'] = tvecs
+            added['RotMatrix'], added['Extrinsics'] = self.Extrinsics(rvecs, tvecs)
+            self.CameraParams.Extend(added)
+            self.Errors(first)
+        
+        if self.app:
+            self.app.scrollarea.print('Views: {}  Mean Reprojection Error [Pixel]: {}'.format(
+                len(self.CameraParams['Imgpoints']), np.round(self.CameraParams['MeanError'],5)))
+    
+    def Prune(self):
+        '''
+        remove the views with a reprojection error over MaxError
+        and calibrate again, starting from the previous intrinsics
+        at least 3 views are kept
+        '''
+
+        self.CameraParams['Pruned'] = []
+        for _ in range(self.MaxIterations):
+            keep = np.asarray(self.CameraParams['Errors']) <= self.MaxError
+            if keep.all() or np.sum(keep) < 3:
+                break
+            self.CameraParams['Pruned'] += [n for n, k in zip(self.ImageNamesRaw, keep) if not k]
+            self.KeepViews(keep)
+            self.Calibration(Guess=True)
+            self.Errors()
+    
+    def KeepViews(self, keep):
+        '''
+        keep only the views marked in the boolean array
+        '''
+
+        self.CameraParams = self.CameraParams.Take(np.flatnonzero(keep))
+        self.ImageNamesRaw = [v for v, k in zip(self.ImageNamesRaw, keep) if k]
+    
+    @Timed('errors')
+    def Errors(self, first=0):
         '''
         Reprojection Errors
+        all views at once on stacked (N, P, ...) arrays
+        with first > 0 the errors of the views before are kept
         '''
 
-        objp = np.array(self.CameraParams['Objpoints'][0])
-        imgp = np.array(self.CameraParams['Imgpoints'])
-        imgp = imgp.reshape((imgp.shape[0], imgp.shape[1], imgp.shape[3]))
-        K = np.array(self.CameraParams['Intrinsic'])
-        D = np.array(self.CameraParams['Distortion'])
-        R = np.array(self.CameraParams['RotVektor'])
-        T = np.array(self.CameraParams['TransVektor'])
-        N = imgp.shape[0] # Views
+        objp = self.CameraParams['Objpoints'][0]
+        imgp = self.CameraParams['Imgpoints'][first:] # (N, P, 2)
         
         # Neue imgp berechnen
-        imgpNew = []
-        for i in range(N):
-            temp, _ = cv2.projectPoints(objp, R[i], T[i], K, D)
-            imgpNew.append(temp.reshape((temp.shape[0], temp.shape[2])))
-        imgpNew = np.array(imgpNew)
+        imgpNew = self.Project(objp, self.CameraParams['RotMatrix'][first:], self.CameraParams['TransVektor'][first:])
         
         # calculate error of every point (x and y)
-        err = []
-        for i in range(N):
-            err.append(imgp[i] - imgpNew[i])
-        err = np.array(err)
-        
-        # mean Errors
-        def RMSE(err):
-            return np.sqrt(np.mean(np.sum(err**2, axis=1)))
+        err = imgp - imgpNew
         
-        errall = np.copy(err[0])
-        rmsePerView = [RMSE(err[0])]
+        # keep the errors of the previous views
+        if first > 0:
+            imgpNew = np.concatenate((self.CameraParams['Reprojectedpoints'][:first], imgpNew))
+            err = np.concatenate((self.CameraParams['Residuals'][:first], err))
         
-        for i in range(1,N):
-            errall = np.vstack((errall, err[i]))
-            rmsePerView.append(RMSE(err[i]))
-            
-        rmseAll = RMSE(errall)
+        # mean Errors
+        sq = np.sum(err**2, axis=2)
+        rmsePerView = np.sqrt(np.mean(sq, axis=1))
+        rmseAll = np.sqrt(np.mean(sq))
         
         self.CameraParams['Errors'] = rmsePerView
         self.CameraParams['MeanError'] = rmseAll
         self.CameraParams['Reprojectedpoints'] = imgpNew
+        self.CameraParams['Residuals'] = err
+    
+    def Project(self, objp, Rmtx, tvecs):
+        '''
+        image points (N, P, 2) of the object points in all views
+        the points are moved into the camera coordinates of every
+        view, then distortion and intrinsics with a single projection
+        '''
+
+        N = len(Rmtx); P = objp.shape[0]
+        K = np.array(self.CameraParams['Intrinsic'])
+        D = np.array(self.CameraParams['Distortion'])
+        R = np.asarray(Rmtx).reshape((N, 3, 3))
+        T = np.asarray(tvecs).reshape((N, 1, 3))
+        
+        cam = np.matmul(objp.astype(np.float64), R.transpose(0, 2, 1)) + T
+        temp, _ = cv2.projectPoints(cam.reshape((N*P, 1, 3)), np.zeros(3), np.zeros(3), K, D)
+        return temp.reshape((N, P, 2)).astype(objp.dtype)
+    
+    @Timed('validation')
+    def Validation(self):
+        '''
+        Reprojection Errors of the held-out views
+        pose of every view with the final intrinsics
+        '''
+
+        K = self.CameraParams['Intrinsic']
+        D = self.CameraParams['Distortion']
+        objp = self.Holdout['Objpoints'][0]
+        imgp = self.Holdout['Imgpoints']
+        N = imgp.shape[0]
+        self.Timing.Count('validation', N)
+        
+        Rmtx = []; tvecs = []
+        for k in range(N):
+            _, r, t = cv2.solvePnP(objp, imgp[k], K, D)
+            Rmtx.append(cv2.Rodrigues(r)[0]); tvecs.append(t)
+        
+        sq = np.sum((imgp - self.Project(objp, Rmtx, tvecs))**2, axis=2)
+        self.CameraParams['ValidationViewIndex'] = list(self.Holdout['ViewIndex'])
+        self.CameraParams['ValidationErrors'] = np.sqrt(np.mean(sq, axis=1))
+        self.CameraParams['ValidationMeanError'] = np.sqrt(np.mean(sq))
     
     def PrintResults(self):
         '''
@@ -120,6 +264,10 @@ class Camera():
                        '  Board Size:       {} x {}\n'.format(self.CameraParams['BoardSize'][0], self.CameraParams['BoardSize'][1]) +
                        '  Image Quantaty:   {}\n'.format(len(self.CameraParams['Objpoints'])) + 
                        '  Points per Image: {}\n'.format(self.CameraParams['Objpoints'][0].shape[0]))
+            
+            if len(self.CameraParams.get('Pruned', [])) > 0:
+                self.app.scrollarea.print('Attention, removed views with error over {} px:\n  {}\n'.format(
+                    self.MaxError, ', '.join(self.CameraParams['Pruned'])), format='warn')
         
             self.app.scrollarea.print('Intrinsic Matrix:\n'+str(self.CameraParams['Intrinsic'])+'\n')
         
@@ -145,25 +293,50 @@ class Camera():
                 k += 1
             self.app.scrollarea.print('')
             self.app.scrollarea.print('Mean Reprojection Error [Pixel]: '+str(np.round(self.CameraParams['MeanError'],5))+'\n')
+            
+            if 'ValidationMeanError' in self.CameraParams:
+                self.app.scrollarea.print('Held-out Views: {}  Mean Reprojection Error [Pixel]: {:.5f}\n'.format(
+                    len(self.CameraParams['ValidationErrors']), self.CameraParams['ValidationMeanError']))
         
             if self.CameraParams['MeanError'] > 1:
                 self.app.scrollarea.print('Attention, Reprojection Error over 1!\n', format='warn')
 
 
+def ImageCount(ImageData):
+    '''
+    images of an image set, with the images without checkerboard
+    and the held-out views
+    '''
+
+    index = list(ImageData.get('ViewIndex', range(len(ImageData['Imgpoints']))))
+    holdout = ImageData.get('Holdout')
+    if holdout is not None:
+        index += list(holdout['ViewIndex'])
+    return max(len(index) + len(ImageData.get('Failed', [])), max(index, default=-1) + 1)
+
 ########################################################
 # Class Stereo:
 # calibrating a stereo camera set
 ########################################################
 
 class Stereo():
-    def __init__(self, LeftData, RightData, app=None):
+    def __init__(self, LeftData, RightData, app=None, RectifyMaps=False, Alpha=-1):
         self.app = app
         self.StereoParams = {}
+        # stages of the stereo camera, the cameras keep their own
+        self.Timing = Timing()
+        self.StereoParams['Timing'] = self.Timing
         self.Left = LeftData
         self.Right = RightData
+        # also store the remap tables of the rectification
+        self.RectifyMaps = RectifyMaps
+        # free scaling of stereoRectify, 0 keeps only valid pixels,
+        # 1 keeps all pixels, -1 is the default of opencv
+        self.Alpha = Alpha
 
         self.ExtractCameraParams()
         self.Calibration()
+        self.Rectification()
         self.PrintResults()
 
     def ExtractCameraParams(self):
@@ -186,21 +359,33 @@ class Stereo():
             name = 'R_'+str(Rkey)
             self.StereoParams[name] = self.Right[Rkey]
     
+    @Timed('stereo')
     def Calibration(self):
         '''
         Calculating the stereo camera parameters 
         '''
 
-        obj = self.StereoParams['L_Objpoints']
-        img1 = self.StereoParams['L_Imgpoints']
+        # pair the views by their index in the image sets,
+        # views skipped or removed on one side are left out
+        for side in ('L_', 'R_'):
+            if len(set(self.StereoParams[side+'ViewIndex'])) != len(self.StereoParams[side+'ViewIndex']):
+                raise ValueError('View indices of the {} camera are not unique.'.format('left' if side == 'L_' else 'right'))
+        Lpos = {v: k for k, v in enumerate(self.StereoParams['L_ViewIndex'])}
+        Rpos = {v: k for k, v in enumerate(self.StereoParams['R_ViewIndex'])}
+        common = [v for v in self.StereoParams['L_ViewIndex'] if v in Rpos]
+        self.StereoParams['ViewIndex'] = common
+        self.Timing.Count('stereo', len(common))
+        
+        obj = [self.StereoParams['L_Objpoints'][Lpos[v]] for v in common]
+        img1 = [self.StereoParams['L_Imgpoints'][Lpos[v]] for v in common]
         k1 = self.StereoParams['L_Intrinsic']
         d1 = self.StereoParams['L_Distortion']
-        img2 = self.StereoParams['R_Imgpoints']
+        img2 = [self.StereoParams['R_Imgpoints'][Rpos[v]] for v in common]
         k2 = self.StereoParams['R_Intrinsic']
         d2 = self.StereoParams['R_Distortion']
         
-        grayL1 = cv2.imread(self.StereoParams['L_ImagePfade'][0], 0)
-        g = grayL1.shape[::-1]
+        h,w = self.StereoParams['ImageSize'][:2]
+        g = (w,h)
         
         # HINT: additional settings for stereoCalibrate function
         criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 1e-5)
@@ -227,6 +412,36 @@ class Stereo():
         # self.StereoParams['R_Intrinsic'] = K2
         # self.StereoParams['R_Distortion'] = D2
     
+    @Timed('rectification')
+    def Rectification(self):
+        '''
+        rectification of the stereo camera, so a downstream
+        pipeline can remap the images without recomputing it
+        '''
+
+        h,w = self.StereoParams['ImageSize'][:2]
+        T = self.StereoParams['Transformation']
+        K1 = self.StereoParams['L_Intrinsic']; D1 = self.StereoParams['L_Distortion']
+        K2 = self.StereoParams['R_Intrinsic']; D2 = self.StereoParams['R_Distortion']
+        
+        R1, R2, P1, P2, Q, roi1, roi2 = cv2.stereoRectify(K1, D1, K2, D2, (w,h), T[:3,:3], T[:3,3], alpha=self.Alpha)
+        
+        self.StereoParams['L_Rectification'] = R1
+        self.StereoParams['R_Rectification'] = R2
+        self.StereoParams['L_Projection'] = P1
+        self.StereoParams['R_Projection'] = P2
+        self.StereoParams['DisparityToDepth'] = Q
+        self.StereoParams['L_RectificationROI'] = np.array(roi1)
+        self.StereoParams['R_RectificationROI'] = np.array(roi2)
+        
+        # fixed point tables, the fastest format for cv2.remap:
+        # Map1 CV_16SC2 integer positions, Map2 CV_16UC1 interpolation
+        if self.RectifyMaps:
+            for side, K, D, R, P in (('L_', K1, D1, R1, P1), ('R_', K2, D2, R2, P2)):
+                map1, map2 = cv2.initUndistortRectifyMap(K, D, R, P, (w,h), cv2.CV_16SC2)
+                self.StereoParams[side+'RectificationMap1'] = map1
+                self.StereoParams[side+'RectificationMap2'] = map2
+    
     def PrintResults(self):
         '''
         plot the results
@@ -241,8 +456,86 @@ class Stereo():
             self.app.scrollarea.print('Fundamentalmatrix:\n'+str(self.StereoParams['Fundamental'])+'\n')
             np.set_printoptions(suppress=True, precision=5)
             
+            self.app.scrollarea.print('Rectified Projection left:\n'+str(self.StereoParams['L_Projection'])+'\n')
+            self.app.scrollarea.print('Rectified Projection right:\n'+str(self.StereoParams['R_Projection'])+'\n')
+            self.app.scrollarea.print('Valid Rectified Region [x, y, w, h]:\n' +
+                       '  left:  {}\n'.format(self.StereoParams['L_RectificationROI']) +
+                       '  right: {}\n'.format(self.StereoParams['R_RectificationROI']))
+            
             self.app.scrollarea.print('Overall Mean Reprojection Error: '+str(np.round(self.StereoParams['MeanError'],5))+'\n')
             
             if self.StereoParams['MeanError'] > 1:
                 self.app.scrollarea.print('Attention, Reprojection Error over 1!\n', format='warn')
-    
\ No newline at end of file
+    
+
+########################################################
+# Parameter File:
+# save the parameters of a single or stereo camera as
+# npz-file, readable with np.load in an other script
+########################################################
+
+# per view data, stored as one stacked array
+VIEW_KEYS = ('Objpoints', 'Imgpoints', 'Reprojectedpoints', 'Residuals',
+             'RotVektor', 'TransVektor', 'RotMatrix', 'Extrinsics')
+
+# per view arrays up to this size are stored without compression
+COMPRESS_SIZE = 4096
+
+def BaseName(key):
+    '''
+    key without the camera prefix (L_, R_ or C0_, C1_, ... of a rig)
+    '''
+
+    prefix, _, name = key.partition('_')
+    if name and (prefix in ('L', 'R') or (prefix[:1] == 'C' and prefix[1:].isdigit())):
+        return name
+    return key
+
+def PackParam(key, value):
+    '''
+    one parameter as contiguous array for the file
+    '''
+
+    name = BaseName(key)
+    # timing report as json text, read with json.loads(str(params['Timing']))
+    if isinstance(value, Timing):
+        return np.asarray(json.dumps(value.Report()))
+    if name in VIEW_KEYS and isinstance(value, (list, tuple)) and len(value) > 0:
+        array = np.stack([np.asarray(v) for v in value])
+    else:
+        array = np.asarray(value)
+    
+    # image points without the additional axis of opencv
+    if name in ('Imgpoints', 'Reprojectedpoints', 'Residuals') and array.ndim == 4:
+        array = array.reshape((array.shape[0], array.shape[1], array.shape[3]))
+    return array
+
+def SaveParams(file, Params, Compress=True):
+    '''
+    save the calculated parameters in a npz-file in one pass
+    the per view data is compressed, all other arrays (intrinsics,
+    remap tables) are stored plain to be read without inflating
+    returns the written file ('.npz' is appended if missing)
+    '''
+
+    if isinstance(file, str) and not file.endswith('.npz'):
+        file += '.npz'
+    # fastest deflate level, the points hardly compress better with higher ones
+    with zipfile.ZipFile(file, 'w', allowZip64=True, compresslevel=1) as zf:
+        for key, value in Params.items():
+            array = PackParam(key, value)
+            name = BaseName(key)
+            deflate = Compress and name in VIEW_KEYS and array.nbytes > COMPRESS_SIZE
+            zf.compression = zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED
+            with zf.open(key+'.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+    return file
+
+def LoadParams(file):
+    '''
+    open a parameter file, every array is read on its first
+    access, so the intrinsics load without the per view data
+    use as context manager or close() it
+    '''
+
+    return np.load(file, allow_pickle=False)
@@ -0,0 +1,443 @@
+# IMPORTS
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# INTERNAL IMPORTS
+from .cal import SingleCamera, StereoCamera, MultiCamera
+from .camera import SaveParams, LoadParams
+from .cache import CACHE_PATH
+from .image import IsVideo
+from .undistort import Undistort
+from .synthetic import Generator, CompareTruth, DefaultIntrinsic, Rotation
+from .timing import Profiler
+from .watch import Watch
+
+# SETTINGS
+np.set_printoptions(suppress=True, precision=5)
+
+########################################################
+# Command Line Interface:
+# headless calibration without tkinter, e.g.
+# python -m optic calibrate --left DIR --square 30
+########################################################
+
+class StreamConsole():
+    '''
+    console without window, writes into a text stream
+    same print signature as the Console of the GUI
+    '''
+
+    def __init__(self, stream=sys.stderr, quiet=False):
+        self.stream = stream
+        self.quiet = quiet
+
+    def print(self, text, pause=1, format='normal'):
+        if self.quiet and not text[:7] == '[ERROR]':
+            return
+        self.stream.write(text + '\n')
+        self.stream.flush()
+
+class Headless():
+    '''
+    replacement of the App for the calibration functions
+    '''
+
+    def __init__(self, quiet=False):
+        self.scrollarea = StreamConsole(quiet=quiet)
+
+def BoardSizeArg(text):
+    '''
+    board size (inner corners) like 11x7
+    '''
+
+    try:
+        size = tuple(int(n) for n in text.lower().replace(',', 'x').split('x'))
+    except ValueError:
+        size = ()
+    if len(size) != 2 or min(size) < 2:
+        raise argparse.ArgumentTypeError('expected inner corners like 11x7, got {!r}'.format(text))
+    return size
+
+def LevelArg(text):
+    '''
+    pyramid level, auto picks it from the image size
+    '''
+
+    if text == 'auto':
+        return None
+    return int(text)
+
+def Parser():
+    parser = argparse.ArgumentParser(prog='python -m optic', description='OPTIC Camera Calibrator without GUI')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cal = commands.add_parser('calibrate', help='calibrate a single or stereo camera')
+    cal.add_argument('--left', required=True, help='image directory or video file of the (left) camera')
+    cal.add_argument('--right', help='image directory or video file of the right camera for stereo calibration')
+    cal.add_argument('--square', type=float, required=True, help='square size in mm')
+    cal.add_argument('--board', type=BoardSizeArg, help='inner corners like 11x7, searched if not given')
+    cal.add_argument('--workers', type=int, default=0, help='processes for the detection, 0 uses all cores')
+    cal.add_argument('--level', type=LevelArg, default=None, help='pyramid level of the detection or auto')
+    cal.add_argument('--cache', default=CACHE_PATH, help='directory of the corner cache')
+    cal.add_argument('--no-cache', dest='cache', action='store_const', const=None, help='disable the corner cache')
+    cal.add_argument('--skip-failed', action='store_true', help='skip images without checkerboard instead of failing')
+    cal.add_argument('--max-error', type=float, help='remove views with a higher reprojection error [px]')
+    cal.add_argument('--max-iterations', type=int, default=3, help='recalibrations after removing views')
+    cal.add_argument('--max-views', type=int, help='calibrate on this many selected views, validate on the rest')
+    cal.add_argument('--video-step', type=int, default=1, help='decode every n-th frame of a video')
+    cal.add_argument('--video-threshold', type=float, default=1.0, help='skip video frames with a smaller mean difference [gray values]')
+    cal.add_argument('--rectify-maps', action='store_true', help='store the remap tables of the stereo rectification')
+    cal.add_argument('--alpha', type=float, default=-1, help='free scaling of the stereo rectification (0 to 1, -1 default)')
+    cal.add_argument('--out', help='npz-file for the parameters')
+    cal.add_argument('--profile', help='write cProfile statistics of the calibration to this file')
+    cal.add_argument('--json', action='store_true', help='print the results as json on stdout')
+    cal.add_argument('--quiet', action='store_true', help='no console output except errors')
+
+    und = commands.add_parser('undistort', help='undistort or rectify a directory or video')
+    und.add_argument('--params', required=True, help='npz-file of a calibration')
+    und.add_argument('--input', required=True, help='image directory or video file')
+    und.add_argument('--out', required=True, help='output directory, or video file for a video input')
+    und.add_argument('--side', help='camera of a stereo calibration (L or R, rectified) or of a rig (C0, C1, ...)')
+    und.add_argument('--crop', action='store_true', help='crop to the valid region')
+    und.add_argument('--workers', type=int, default=0, help='threads, 0 uses all cores')
+    und.add_argument('--json', action='store_true', help='print the results as json on stdout')
+    und.add_argument('--quiet', action='store_true', help='no console output except errors')
+
+    wat = commands.add_parser('watch', help='calibrate while the images are captured into the folders')
+    wat.add_argument('--left', required=True, help='image directory of the (left) camera')
+    wat.add_argument('--right', help='image directory of the right camera for stereo calibration')
+    wat.add_argument('--square', type=float, required=True, help='square size in mm')
+    wat.add_argument('--board', type=BoardSizeArg, help='inner corners like 11x7, searched if not given')
+    wat.add_argument('--workers', type=int, default=0, help='processes for the detection, 0 uses all cores')
+    wat.add_argument('--level', type=LevelArg, default=None, help='pyramid level of the detection or auto')
+    wat.add_argument('--interval', type=float, default=1.0, help='seconds between two looks into the folders')
+    wat.add_argument('--period', type=float, default=5.0, help='seconds between two calibrations')
+    wat.add_argument('--min-views', type=int, default=5, help='views of every camera for the first calibration')
+    wat.add_argument('--idle', type=float, help='stop if no new image appeared for this many seconds (default: Ctrl-C)')
+    wat.add_argument('--out', help='npz-file for the final parameters')
+    wat.add_argument('--json', action='store_true', help='print the final results as json on stdout')
+    wat.add_argument('--quiet', action='store_true', help='no console output except errors')
+
+    rig = commands.add_parser('rig', help='calibrate a rig of two or more cameras')
+    rig.add_argument('--cameras', nargs='+', required=True, metavar='DIR', help='image directory of every camera, the k-th images are one view')
+    rig.add_argument('--square', type=float, required=True, help='square size in mm')
+    rig.add_argument('--board', type=BoardSizeArg, help='inner corners like 11x7, searched if not given')
+    rig.add_argument('--workers', type=int, default=0, help='processes for the detection, 0 uses all cores')
+    rig.add_argument('--level', type=LevelArg, default=None, help='pyramid level of the detection or auto')
+    rig.add_argument('--cache', default=CACHE_PATH, help='directory of the corner cache')
+    rig.add_argument('--no-cache', dest='cache', action='store_const', const=None, help='disable the corner cache')
+    rig.add_argument('--max-error', type=float, help='remove views with a higher reprojection error [px]')
+    rig.add_argument('--max-iterations', type=int, default=3, help='recalibrations after removing views')
+    rig.add_argument('--reference', type=int, default=0, help='camera of the rig coordinate system')
+    rig.add_argument('--pairs', choices=('tree', 'all'), default='tree', help='calibrate a spanning tree or all overlapping pairs')
+    rig.add_argument('--min-views', type=int, default=3, help='common views of a pair to calibrate it')
+    rig.add_argument('--out', help='npz-file for the parameters')
+    rig.add_argument('--json', action='store_true', help='print the results as json on stdout')
+    rig.add_argument('--quiet', action='store_true', help='no console output except errors')
+
+    gen = commands.add_parser('generate', help='render synthetic checkerboard images with known parameters')
+    gen.add_argument('--out', required=True, help='output directory (left/, right/ and truth.npz)')
+    gen.add_argument('--views', type=int, default=20, help='number of views')
+    gen.add_argument('--board', type=BoardSizeArg, default=(11,7), help='inner corners like 11x7')
+    gen.add_argument('--square', type=float, default=30.0, help='square size in mm')
+    gen.add_argument('--size', type=SizeArg, default=(576,1024), help='image size like 1024x576 (width x height)')
+    gen.add_argument('--focal', type=float, help='focal length [px], default 0.9 * width')
+    gen.add_argument('--distortion', type=float, nargs='+', default=[-0.2, 0.1, 0, 0, 0], help='k1 k2 p1 p2 [k3 ...]')
+    gen.add_argument('--stereo', type=float, default=None, metavar='BASELINE', help='stereo camera with this baseline [mm]')
+    gen.add_argument('--noise', type=float, default=2.0, help='gaussian noise [gray values]')
+    gen.add_argument('--blur', type=float, default=0.7, help='gaussian blur [px]')
+    gen.add_argument('--max-angle', type=float, default=40.0, help='max. tilt of the board [deg]')
+    gen.add_argument('--seed', type=int, default=0, help='random seed of the poses and the noise')
+    gen.add_argument('--workers', type=int, default=0, help='processes, 0 uses all cores')
+    gen.add_argument('--check', action='store_true', help='calibrate the images and compare with the ground truth')
+    gen.add_argument('--json', action='store_true', help='print the results as json on stdout')
+    gen.add_argument('--quiet', action='store_true', help='no console output except errors')
+    return parser
+
+def SizeArg(text):
+    '''
+    image size like 1024x576, returned as (height, width)
+    '''
+
+    try:
+        w, h = (int(n) for n in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected width x height like 1024x576, got {!r}'.format(text))
+    return (h, w)
+
+def Summary(Params, stereo):
+    '''
+    machine readable subset of the parameters
+    '''
+
+    keys = ['BoardSize', 'ImageSize', 'SquareSize', 'MeanError']
+    for key in ('ValidationMeanError', 'L_ValidationMeanError', 'R_ValidationMeanError'):
+        if key in Params:
+            keys.append(key)
+    if stereo:
+        keys += ['Transformation', 'Essential', 'Fundamental',
+                 'L_Rectification', 'R_Rectification', 'L_Projection', 'R_Projection', 'DisparityToDepth',
+                 'L_RectificationROI', 'R_RectificationROI',
+                 'L_Intrinsic', 'L_Distortion', 'L_MeanError',
+                 'R_Intrinsic', 'R_Distortion', 'R_MeanError']
+    else:
+        keys += ['Intrinsic', 'Distortion', 'DistortionIntrinsic', 'DistortionROI']
+    summary = {}
+    for key in keys:
+        summary[key] = np.asarray(Params[key]).tolist()
+    prefix = 'L_' if stereo else ''
+    summary['Views'] = len(Params[prefix+'Imgpoints'])
+    return summary
+
+def Save(app, file, Params):
+    '''
+    save the parameters, returns the written file or None
+    '''
+
+    try:
+        file = SaveParams(file, Params)
+    except (OSError, ValueError) as e:
+        app.scrollarea.print('[ERROR] Parameters not saved: {}'.format(e))
+        return None
+    app.scrollarea.print('Parameters saved under:\n{}\n'.format(file))
+    return file
+
+def Calibrate(args):
+    '''
+    run the calibration, returns the exit code
+    '''
+
+    app = Headless(quiet=args.quiet)
+    for path in (args.left, args.right):
+        if path is not None and not (os.path.isdir(path) or IsVideo(path)):
+            app.scrollarea.print('[ERROR] No directory or video file: {}'.format(path))
+            return 2
+
+    settings = dict(BoardSize=args.board, Workers=args.workers, PyramidLevel=args.level, CachePath=args.cache,
+                    SkipFailed=args.skip_failed, MaxError=args.max_error, MaxIterations=args.max_iterations,
+                    MaxViews=args.max_views, VideoStep=args.video_step, VideoThreshold=args.video_threshold)
+    timings = {}
+
+    start = time.perf_counter()
+    with Profiler(args.profile):
+        if args.right is None:
+            Params = SingleCamera(app, args.left, args.square, **settings)
+        else:
+            Params = StereoCamera(app, args.left, args.right, args.square, RectifyMaps=args.rectify_maps, Alpha=args.alpha, **settings)
+    timings['calibration'] = time.perf_counter() - start
+    if args.profile:
+        app.scrollarea.print('Profile saved under:\n{}\n'.format(args.profile))
+
+    if Params is None:
+        if args.json:
+            print(json.dumps({'success': False, 'timings': timings}))
+        return 1
+
+    file = None
+    if args.out:
+        # the report is written by the save, its time is in timings only
+        start = time.perf_counter()
+        file = Save(app, args.out, Params)
+        timings['save'] = time.perf_counter() - start
+        if file is None:
+            if args.json:
+                print(json.dumps({'success': False, 'timings': timings}))
+            return 1
+
+    app.scrollarea.print('time for calibration: {:.4f} seconds\n'.format(timings['calibration']))
+    if args.json:
+        result = {'success': True, 'file': file, 'timings': timings}
+        # report of every camera, the stereo stages without prefix
+        result['stages'] = {key: Params[key].Report() for key in ('Timing', 'L_Timing', 'R_Timing') if key in Params}
+        result.update(Summary(Params, args.right is not None))
+        print(json.dumps(result))
+    return 0
+
+def UndistortCommand(args):
+    '''
+    undistort the input, returns the exit code
+    '''
+
+    app = Headless(quiet=args.quiet)
+    if not (os.path.isdir(args.input) or IsVideo(args.input)):
+        app.scrollarea.print('[ERROR] No directory or video file: {}'.format(args.input))
+        return 2
+    try:
+        Params = LoadParams(args.params)
+    except (OSError, ValueError):
+        app.scrollarea.print('[ERROR] No parameter file: {}'.format(args.params))
+        return 2
+    if args.side is None and 'L_Intrinsic' in Params:
+        app.scrollarea.print('[ERROR] Stereo parameters, choose the camera with --side L or R.')
+        return 2
+    if args.side is None and 'C0_Intrinsic' in Params:
+        app.scrollarea.print('[ERROR] Rig parameters, choose the camera with --side C0, C1, ...')
+        return 2
+    if args.side is not None and args.side+'_Intrinsic' not in Params:
+        app.scrollarea.print('[ERROR] No camera {} in {}'.format(args.side, args.params))
+        return 2
+
+    try:
+        count, duration = Undistort(Params, args.input, args.out, Side=args.side or '', Crop=args.crop, Workers=args.workers)
+    except (OSError, ValueError) as e:
+        app.scrollarea.print('[ERROR] {}'.format(e))
+        return 1
+    rate = count / duration if duration > 0 else 0.0
+    app.scrollarea.print('{} frames in {:.4f} seconds ({:.1f} frames/s)\n'.format(count, duration, rate))
+    if args.json:
+        print(json.dumps({'success': True, 'frames': count, 'seconds': duration, 'fps': rate, 'out': args.out}))
+    return 0
+
+def WatchCommand(args):
+    '''
+    watch the folders until idle or Ctrl-C, returns the exit code
+    '''
+
+    app = Headless(quiet=args.quiet)
+    paths = [path for path in (args.left, args.right) if path is not None]
+    for path in paths:
+        if not os.path.isdir(path):
+            app.scrollarea.print('[ERROR] No directory: {}'.format(path))
+            return 2
+
+    watch = Watch(paths, args.square, app, BoardSize=args.board, Workers=args.workers, PyramidLevel=args.level,
+                  Interval=args.interval, Period=args.period, MinViews=args.min_views)
+    app.scrollarea.print('Watching {} (stop with Ctrl-C) ...'.format(' and '.join(paths)))
+    try:
+        watch.Run(Idle=args.idle)
+    except KeyboardInterrupt:
+        app.scrollarea.print('stopped, calibrating the remaining views ...')
+    Params = watch.Finish()
+
+    if Params is None:
+        app.scrollarea.print('[ERROR] Not enough views with checkerboard for a calibration.')
+        if args.json:
+            print(json.dumps({'success': False}))
+        return 1
+    file = None
+    if args.out:
+        file = Save(app, args.out, Params)
+        if file is None:
+            if args.json:
+                print(json.dumps({'success': False}))
+            return 1
+    if args.json:
+        result = {'success': True, 'file': file}
+        result.update(Summary(Params, args.right is not None))
+        print(json.dumps(result))
+    return 0
+
+def RigCommand(args):
+    '''
+    calibrate the rig, returns the exit code
+    '''
+
+    app = Headless(quiet=args.quiet)
+    if len(args.cameras) < 2:
+        app.scrollarea.print('[ERROR] A rig needs at least two cameras.')
+        return 2
+    for path in args.cameras:
+        if not os.path.isdir(path):
+            app.scrollarea.print('[ERROR] No directory: {}'.format(path))
+            return 2
+    if not 0 <= args.reference < len(args.cameras):
+        app.scrollarea.print('[ERROR] No camera {} in the rig.'.format(args.reference))
+        return 2
+
+    settings = dict(BoardSize=args.board, Workers=args.workers, PyramidLevel=args.level, CachePath=args.cache,
+                    MaxError=args.max_error, MaxIterations=args.max_iterations)
+    start = time.perf_counter()
+    Params = MultiCamera(app, args.cameras, args.square, Pairs=args.pairs, Reference=args.reference,
+                         MinViews=args.min_views, **settings)
+    duration = time.perf_counter() - start
+    if Params is None:
+        if args.json:
+            print(json.dumps({'success': False, 'timings': {'calibration': duration}}))
+        return 1
+
+    file = None
+    timings = {'calibration': duration}
+    if args.out:
+        start = time.perf_counter()
+        file = Save(app, args.out, Params)
+        timings['save'] = time.perf_counter() - start
+        if file is None:
+            if args.json:
+                print(json.dumps({'success': False, 'timings': timings}))
+            return 1
+    app.scrollarea.print('time for calibration: {:.4f} seconds\n'.format(duration))
+    if args.json:
+        result = {'success': True, 'file': file, 'timings': timings}
+        result['stages'] = Params['Timing'].Report()
+        for key in ('BoardSize', 'SquareSize', 'Cameras', 'Reference', 'MeanError', 'Pairs', 'PairErrors',
+                    'PairViews', 'Tree', 'LoopPairs', 'LoopErrors'):
+            result[key] = np.asarray(Params[key]).tolist()
+        result['Rig'] = [{key: np.asarray(Params['C{}_{}'.format(k, key)]).tolist()
+                          for key in ('ImageSize', 'Intrinsic', 'Distortion', 'MeanError', 'Transformation')}
+                         for k in range(Params['Cameras'])]
+        print(json.dumps(result))
+    return 0
+
+def GenerateCommand(args):
+    '''
+    render the synthetic images, returns the exit code
+    '''
+
+    app = Headless(quiet=args.quiet)
+    K = DefaultIntrinsic(args.size)
+    if args.focal:
+        K[0, 0] = K[1, 1] = args.focal
+    T = None
+    if args.stereo:
+        # right camera beside the left one, turned slightly inwards
+        T = np.eye(4); T[:3, :3] = Rotation(0, -2, 0); T[0, 3] = -args.stereo
+    generator = Generator(BoardSize=args.board, SquareSize=args.square, ImageSize=args.size, Intrinsic=K,
+                          Distortion=args.distortion, Transformation=T, MaxAngle=args.max_angle,
+                          Noise=args.noise, Blur=args.blur, Seed=args.seed)
+    start = time.perf_counter()
+    try:
+        truth = generator.Generate(args.out, Views=args.views, Workers=args.workers)
+    except ValueError as e:
+        app.scrollarea.print('[ERROR] {}'.format(e))
+        return 1
+    duration = time.perf_counter() - start
+    images = args.views * (2 if T is not None else 1)
+    app.scrollarea.print('{} images in {:.4f} seconds ({:.1f} images/s)\n'.format(images, duration, images/duration))
+    result = {'success': True, 'out': args.out, 'images': images, 'seconds': duration}
+
+    if args.check:
+        left = os.path.join(args.out, 'left'); right = os.path.join(args.out, 'right')
+        settings = dict(BoardSize=args.board, Workers=args.workers, CachePath=None)
+        if T is None:
+            Params = SingleCamera(app, left, args.square, **settings)
+        else:
+            Params = StereoCamera(app, left, right, args.square, **settings)
+        if Params is None:
+            return 1
+        result['MeanError'] = float(Params['MeanError'])
+        result.update(CompareTruth(truth, Params))
+        app.scrollarea.print('Difference to the ground truth:')
+        for key, value in result.items():
+            if key.endswith('Error'):
+                app.scrollarea.print('  {:<20} {:.6f}'.format(key, value))
+    if args.json:
+        print(json.dumps(result))
+    return 0
+
+def main(argv=None):
+    args = Parser().parse_args(argv)
+    if args.command == 'calibrate':
+        return Calibrate(args)
+    if args.command == 'undistort':
+        return UndistortCommand(args)
+    if args.command == 'watch':
+        return WatchCommand(args)
+    if args.command == 'rig':
+        return RigCommand(args)
+    if args.command == 'generate':
+        return GenerateCommand(args)
+    return 2
@@ -14,7 +14,7 @@ class Console(ScrolledText):
     Console class for the output window
     '''
 
-    def __init__(self, console, height=25, width=70):
+    def __init__(self, console, height=25, width=70, buffered=True, interval=50, pacing=0):
         super().__init__(console, state='disabled', wrap=tkinter.WORD, height=height, width=width)
         #self.scrollarea = ScrolledText(self.console, state='disabled', wrap=tkinter.WORD, height=25, width=70)
         self.grid(column=0)
@@ -22,12 +22,24 @@ class Console(ScrolledText):
         self.tag_config('success', foreground="#13D60C")
         self.tag_config('error', foreground="#FF0000")
         self.tag_config('warn', foreground="#FFB217")
+        
+        # buffered: lines are collected and written every interval [ms]
+        # pacing: max. lines per write for a smoother output, 0 writes all
+        # unbuffered: every line is written and drawn at once and
+        # followed by timepause [s] if printed with pause=1
+        self.buffered = buffered
+        self.interval = interval
+        self.pacing = pacing
+        self.timepause = 0
+        self.buffer = []
+        self.pending = None
     
     def clear(self):
         '''
         reset the console to default
         '''
 
+        self.buffer = []
         self.configure(state='normal')
         self.delete('1.0', tkinter.END)
         self.print("--------------------------------------------------------------------",1)
@@ -39,25 +51,51 @@ class Console(ScrolledText):
         self.print("\nCopyright 2026. Version {}".format(self.VERSIONINDEX),1)
         self.print("--------------------------------------------------------------------\n",1)
         self.print("Time: {}\n".format(time.strftime('%d.%m.%Y , %H:%M Uhr')))
-        self.configure(state='disabled')
-        self.update()
+        self.flush()
 
     def print(self, text, pause=1, format='normal'):
         '''
         function to plot some formatted text into the console.
         '''
 
-        self.configure(state='normal')
         if text[:7] == '[ERROR]':
-            self.insert(tkinter.END, text, 'error')
+            format = 'error'
+        self.buffer.append((text + '\n', format))
+        
+        if not self.buffered:
+            self.flush()
+            self.update()
+            # waiting a little bit for smoother output
+            if pause == 1 and self.timepause > 0:
+                time.sleep(self.timepause)
+        elif self.pending is None:
+            self.pending = self.after(self.interval, self.flush)
+
+    def flush(self):
+        '''
+        write the buffered lines into the console
+        '''
+
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+            self.pending = None
+        if len(self.buffer) == 0:
+            return
+        
+        if self.pacing > 0:
+            lines, self.buffer = self.buffer[:self.pacing], self.buffer[self.pacing:]
         else:
-            self.insert(tkinter.END, text, format)
-        self.insert(tkinter.END, '\n')
+            lines, self.buffer = self.buffer, []
+        
+        # one insert with alternating text and tag arguments
+        args = []
+        for text, format in lines:
+            args += [text, format]
+        self.configure(state='normal')
+        self.insert(tkinter.END, *args)
         self.configure(state='disabled')
         self.yview(tkinter.END)
-        self.update()
         
-        # waiting a little bit for smoother output
-        if pause == 1:
-            self.timestopper += 1
-            time.sleep(self.timepause)
+        # the rest is written with the next interval
+        if len(self.buffer) > 0:
+            self.pending = self.after(self.interval, self.flush)
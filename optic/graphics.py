@@ -4,11 +4,13 @@ import tkinter.filedialog
 from tkinter import ttk, HORIZONTAL, VERTICAL
 import time
 import os
-import numpy as np
+import queue
+import threading
 
 # INTERNAL IMPORTS
-from .cal import SingleCamera, StereoCamera
 from .console import Console
+from .cache import CACHE_PATH
+# the calibration modules (cv2, numpy) are imported by LoadModules
 
 # VARIABLES
 #from .__init__ import LEFT_PATH, RIGHT_PATH, SQUARE_SIZE
@@ -17,8 +19,54 @@ RIGHT_PATH = './example/example_right_30mm/'
 SQUARE_SIZE = 30.0  # in mm
 VERSIONINDEX = '1.2.2'
 
-# SETTINGS
-np.set_printoptions(suppress=True, precision=5)
+########################################################
+# Background Import:
+# cv2 and numpy take longer to import than the window
+# to appear, so they are loaded in a thread meanwhile
+########################################################
+
+def LoadModules():
+    '''
+    import the calibration modules, safe to call from
+    every thread, waits for an import still running
+    '''
+
+    import numpy as np
+    from . import cal, camera, image
+    np.set_printoptions(suppress=True, precision=5)
+
+########################################################
+# Class Worker:
+# replaces the App inside the calibration thread, all
+# output goes through a queue drained by the GUI
+########################################################
+
+class QueueConsole():
+    '''
+    same print signature as the Console
+    '''
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def print(self, text, pause=1, format='normal'):
+        self.messages.put(('print', text, pause, format))
+
+class Worker():
+    '''
+    state of one calibration run in the background thread
+    '''
+
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.scrollarea = QueueConsole(self.messages)
+        self.Cancel = threading.Event()
+
+    def Progress(self, done, total):
+        self.messages.put(('progress', done, total))
+        if self.Cancel.is_set():
+            from .cal import CalibrationCancelled
+            raise CalibrationCancelled()
 
 ########################################################
 # Class App:
@@ -41,8 +89,12 @@ class App():
         self.master = master
         self.master.title('Camera Calibrator App')
         self.master.resizable(0,0)
-        self.timestopper = 0
-        self.timepause = 0.02
+        self.Workers = os.cpu_count() # processes for the corner detection
+        self.PyramidLevel = None # coarse detection level, None: from image size
+        self.CachePath = CACHE_PATH # detected corners of earlier runs
+        self.SkipFailed = True # images without checkerboard are skipped
+        self.MaxIterations = 3 # recalibrations after removing bad views
+        self.RectifyMaps = False # store the stereo remap tables in the file
         self.VERSIONINDEX = VERSIONINDEX
         
         # DEFINE AREA's
@@ -70,9 +122,13 @@ class App():
         ttk.Label(self.formframe, text='left camera:                ').grid(row=15, column=0, sticky='w')
         self.InputButtonLeft = ttk.Button(self.formframe, text='Search', command=lambda: self._input_folders(direction='left'))
         self.InputButtonLeft.grid(row=15,column=1,sticky='nw')
+        self.VideoButtonLeft = ttk.Button(self.formframe, text='Video', command=lambda: self._input_folders(direction='left', video=True))
+        self.VideoButtonLeft.grid(row=15,column=2,sticky='nw')
         ttk.Label(self.formframe, text='right camera:').grid(row=16, column=0 ,sticky='w')
         self.InputButtonRight = ttk.Button(self.formframe, text='Search', command=lambda: self._input_folders(direction='right'))
         self.InputButtonRight.grid(row=16,column=1,sticky='nw')
+        self.VideoButtonRight = ttk.Button(self.formframe, text='Video', command=lambda: self._input_folders(direction='right', video=True))
+        self.VideoButtonRight.grid(row=16,column=2,sticky='nw')
         
         ttk.Label(self.formframe, text=' ').grid(row=20, column=0 ,sticky='nw')
         ttk.Label(self.formframe, text='Checkerboard:', font='TkDefaultFont 12 bold').grid(row=21, column=0, columnspan=3, sticky='nw')
@@ -80,12 +136,21 @@ class App():
         ttk.Label(self.formframe, text='Square Size [mm]:').grid(row=25, column=0 ,sticky='nw')
         self.entry = tkinter.DoubleVar(); self.entry.set(SQUARE_SIZE)
         tkinter.Entry(self.formframe, textvariable=self.entry, justify='right', width=12).grid(row=25,column=1,sticky='nw',columnspan=8)
+        ttk.Label(self.formframe, text='Board Size [optional]:').grid(row=26, column=0 ,sticky='nw')
+        self.boardentry = tkinter.StringVar(); self.boardentry.set('')
+        tkinter.Entry(self.formframe, textvariable=self.boardentry, justify='right', width=12).grid(row=26,column=1,sticky='nw',columnspan=8)
+        ttk.Label(self.formframe, text='Max. Error [px, optional]:').grid(row=27, column=0 ,sticky='nw')
+        self.errorentry = tkinter.StringVar(); self.errorentry.set('')
+        tkinter.Entry(self.formframe, textvariable=self.errorentry, justify='right', width=12).grid(row=27,column=1,sticky='nw',columnspan=8)
         
         ttk.Label(self.formframe, text=' ').grid(row=30, column=0 ,sticky='nw')
         ttk.Label(self.formframe, text='Calibration:', font='TkDefaultFont 12 bold').grid(row=31, column=0, sticky='w')
         self.InputButtonStart = ttk.Button(self.formframe, text=' Start ', command=self.StartButton)
         self.InputButtonStart.grid(row=31,column=1, sticky='nw')
-        ttk.Label(self.formframe, text=' ').grid(row=31, column=2 ,sticky='nw')
+        self.InputButtonCancel = ttk.Button(self.formframe, text='Cancel', command=self.CancelButton, state=tkinter.DISABLED)
+        self.InputButtonCancel.grid(row=31,column=2, sticky='nw')
+        self.ProgressBar = ttk.Progressbar(self.formframe, orient=HORIZONTAL, mode='determinate', maximum=100)
+        self.ProgressBar.grid(row=32, column=0, columnspan=3, sticky='we')
         
         ttk.Label(self.formframe, text=' ').grid(row=40, column=2 ,sticky='nw')
         self.StatusLabelText = tkinter.StringVar()
@@ -94,10 +159,8 @@ class App():
         self.StatusLabel.grid(row=41, column=0, columnspan=3, sticky='nw')
         
         # CONSOLE
-        self.scrollarea = Console(self.console, height=25, width=70)
+        self.scrollarea = Console(self.console, height=25, width=70, buffered=True, pacing=0)
         self.scrollarea.VERSIONINDEX = self.VERSIONINDEX
-        self.scrollarea.timepause = self.timepause
-        self.scrollarea.timestopper = self.timestopper
         self.scrollarea.clear()
 
         self._create_menu()
@@ -108,6 +171,10 @@ class App():
         self.Art = ''
         self.CalibrationCompleted = False
         self.CalBegonnen = False
+        self.Worker = None
+        
+        # import cv2 and numpy after the window is drawn
+        self.master.after(100, lambda: threading.Thread(target=LoadModules, daemon=True).start())
 
     def _create_menu(self):
         '''
@@ -146,27 +213,19 @@ class App():
             if file == '':
                 return
             
-            # save single camera parameters
-            if self.Art == 'Single':
-                d = self.CameraParams
-                np.savez(file, **d)
-                npz = dict(np.load(file))
-                size = (npz['Imgpoints'].shape[0], npz['Imgpoints'].shape[1], npz['Imgpoints'].shape[3])
-                npz['Imgpoints'] = np.resize(npz.pop('Imgpoints'), size)
-                np.savez(file, **npz)
-                
-            # save stereo camera parameters
-            elif self.Art == 'Stereo':
-                d = self.StereoParams
-                np.savez(file, **d)
-                npz = dict(np.load(file))
-                size = (npz['L_Imgpoints'].shape[0], npz['L_Imgpoints'].shape[1], npz['L_Imgpoints'].shape[3])
-                npz['L_Imgpoints'] = np.resize(npz.pop('L_Imgpoints'), size)
-                npz['R_Imgpoints'] = np.resize(npz.pop('R_Imgpoints'), size)
-                np.savez(file, **npz)
+            # save single or stereo camera parameters
+            from .camera import SaveParams
+            Params = self.CameraParams if self.Art == 'Single' else self.StereoParams
+            start = time.perf_counter()
+            try:
+                file = SaveParams(file, Params)
+            except (OSError, ValueError) as e:
+                self.scrollarea.print('[ERROR] Parameters not saved: {}'.format(e))
+                return
                 
             self.scrollarea.print('\n--------------------------------------------------------------------\n')
             self.scrollarea.print('Parameters saved under:\n{}'.format(file))
+            self.scrollarea.print('time for saving: {:.4f} seconds'.format(time.perf_counter() - start))
             self.scrollarea.print('\n--------------------------------------------------------------------\n')
         else:
             self.scrollarea.print('[ERROR] No Parameters. Calibrate first!')
@@ -179,9 +238,16 @@ class App():
         Reset the whole application in order to start a new calibration
         '''
 
+        # a running calibration is not needed anymore
+        if self.Worker is not None:
+            self.CancelButton()
+            return
+        
         self.StatusLabelText.set(' ')
         self.SwitchButtonState('NORMAL')
         self.entry.set(30.0)
+        self.boardentry.set('')
+        self.errorentry.set('')
         self.formframe.update()
         self.scrollarea.clear()
         
@@ -190,7 +256,6 @@ class App():
         self.Art = ''
         self.CalibrationCompleted = False
         self.CalBegonnen = False
-        self.timestopper = 0
         
     def _menu_about(self):
         '''
@@ -212,18 +277,25 @@ class App():
         self.scrollarea.print(txt)
         self.scrollarea.print('\n--------------------------------------------------------------------\n')
 
-    def _input_folders(self, direction=None):
+    def _input_folders(self, direction=None, video=False):
         '''
-        input directory of the camera(s)
+        input directory or video file of the camera(s)
         '''
 
+        if video:
+            from .image import VIDEO_TYPES
+            types = ' '.join('*'+t for t in VIDEO_TYPES)
+            ask = lambda: tkinter.filedialog.askopenfilename(filetypes=[('Video', types), ('All files', '*')])
+        else:
+            ask = tkinter.filedialog.askdirectory
+        
         if direction == 'left':
-            self.LeftPath = tkinter.filedialog.askdirectory()
+            self.LeftPath = ask()
             self.scrollarea.print('Path left camera:')
             self.scrollarea.print(self.LeftPath)
             self.scrollarea.print('')
         elif direction == 'right':
-            self.RightPath = tkinter.filedialog.askdirectory()
+            self.RightPath = ask()
             self.scrollarea.print('Path right camera:')
             self.scrollarea.print(self.RightPath)
             self.scrollarea.print('')
@@ -243,6 +315,31 @@ class App():
             self.scrollarea.print('[ERROR] Fehlerhafte Angabe der Square Size.')
             return False
         
+        # BOARD SIZE ---------------------------------------------------------
+        # inner corners like 11x7, empty for automatic detection
+        
+        board = self.boardentry.get().strip().lower().replace(',', 'x')
+        if board == '':
+            self.BoardSize = None
+        else:
+            try:
+                self.BoardSize = tuple(int(n) for n in board.split('x'))
+            except ValueError:
+                self.BoardSize = ()
+            if len(self.BoardSize) != 2 or min(self.BoardSize) < 2:
+                self.scrollarea.print('[ERROR] Fehlerhafte Angabe der Board Size (z.B. 11x7).')
+                return False
+        
+        # MAX ERROR ----------------------------------------------------------
+        # views with a higher reprojection error are removed, empty keeps all
+        
+        maxerror = self.errorentry.get().strip()
+        try:
+            self.MaxError = float(maxerror) if maxerror != '' else None
+        except ValueError:
+            self.scrollarea.print('[ERROR] Fehlerhafte Angabe des Max. Error.')
+            return False
+        
         # DIRECTORIES --------------------------------------------------------
         
         left = str(self.LeftPath); right = str(self.RightPath)
@@ -272,10 +369,12 @@ class App():
         # directories cannot be empty
         # images have to be the same datatype
         # possible types: bmp, jpeg, jpg, png, tiff, tif
+        # a video file is read frame by frame instead
         
         types = ['bmp', 'jpeg', 'jpg', 'png', 'tiff', 'tif']
+        from .image import IsVideo
         
-        if self.Art=='Stereo' or self.Seite=='L':
+        if (self.Art=='Stereo' or self.Seite=='L') and not IsVideo(left):
             l = os.listdir(left)
             if len(l) == 0:
                 self.scrollarea.print('[ERROR] Linker Ordner ist leer.')
@@ -294,7 +393,7 @@ class App():
                 self.scrollarea.print('[ERROR] Ungültiger Dateityp: {}'.format(endsL[0].lower()))
                 return False
             
-        if self.Art=='Stereo' or self.Seite=='R':
+        if (self.Art=='Stereo' or self.Seite=='R') and not IsVideo(right):
             r = os.listdir(right)
             if len(r) == 0:
                 self.scrollarea.print('[ERROR] Rechter Ordner ist leer.')
@@ -315,7 +414,7 @@ class App():
             
         # same number of images for both cameras for stereo calibration
         
-        if self.Art == 'Stereo':
+        if self.Art == 'Stereo' and not (IsVideo(left) or IsVideo(right)):
             if len(l) != len(r):
                 self.scrollarea.print('[ERROR] Pro Kamera müssen gleich viele Bilder existieren.')
                 return False
@@ -342,69 +441,127 @@ class App():
         '''
         Start Button definition
         starts the calibration process after checking the inputs
+        the calibration runs in a thread, the GUI stays responsive
         '''
 
         if self.CheckInput():
             
             self.scrollarea.clear()
             self.CalBegonnen = True
+            self.CalibrationCompleted = False
             self.StatusLabelText.set('calibrating, please wait ...')
             self.SwitchButtonState('DISABLED')
+            self.ProgressBar['value'] = 0
             
+            self.scrollarea.print('--------------------------------------------------------------------\n')
+            self.scrollarea.print('INPUT PARAMETERS:\n')
             if self.Art == 'Stereo':
-                
-                self.StartTime = time.perf_counter(); self.timestopper = 0
-                self.scrollarea.print('--------------------------------------------------------------------\n')
-                self.scrollarea.print('INPUT PARAMETERS:\n')
                 self.scrollarea.print('Source folder left camera: {}'.format(self.LeftPath))
                 self.scrollarea.print('Source folder right camera: {}'.format(self.RightPath))
-                self.scrollarea.print('Square Size: {} mm\n'.format(self.SquareSize))
-                self.scrollarea.print('--------------------------------------------------------------------\n')
-                self.scrollarea.print('STEREO CAMERA CALIBRATION\n')
-                self.scrollarea.print('--------------------------------------------------------------------\n')
-                self.StereoParams = StereoCamera(self, self.LeftPath, self.RightPath, self.SquareSize)
-                
-                if not self.StereoParams == None:
-                    self.StatusLabelText.set('Calibration done.')
-                    self.CalibrationCompleted = True
-                    
-                if self.CalibrationCompleted:
-                    end = time.perf_counter() - self.StartTime - self.timestopper * self.timepause
-                    self.scrollarea.print('time for calibration: {:.4f} seconds\n'.format(end))
-                    self.scrollarea.print('--------------------------------------------------------------------\n')
-                    self.scrollarea.print('CALIBRATION SUCCESSFULL\n', format='success')
-                    self.scrollarea.print('--------------------------------------------------------------------\n')
-                    self.save_log(mode='auto')
-                    
             elif self.Art == 'Single':
-                
-                self.StartTime = time.perf_counter(); self.timestopper = 0
-                self.scrollarea.print('--------------------------------------------------------------------\n')
-                self.scrollarea.print('INPUT PARAMETERS:\n')
                 self.scrollarea.print('Source folder: {}'.format(self.SinglePath))
-                self.scrollarea.print('Square Size: {} mm\n'.format(self.SquareSize))
-                self.scrollarea.print('--------------------------------------------------------------------\n')
-                self.scrollarea.print('SINGLE CAMERA CALIBRATION\n')
-                self.scrollarea.print('--------------------------------------------------------------------\n')
-                self.CameraParams = SingleCamera(self, self.SinglePath, self.SquareSize)
-                
-                if not self.CameraParams == None:
-                    self.StatusLabelText.set('Calibration done.')
-                    self.CalibrationCompleted = True
-                    
-                if self.CalibrationCompleted:
-                    end = time.perf_counter() - self.StartTime - self.timestopper * self.timepause
-                    self.scrollarea.print('time for calibration: {:.4f} seconds\n'.format(end))
-                    self.scrollarea.print('--------------------------------------------------------------------\n')
-                    self.scrollarea.print('CALIBRATION SUCCESSFULL\n', format='success')
-                    self.scrollarea.print('--------------------------------------------------------------------\n')
-                    self.save_log(mode='auto')
-                    
-            if self.CalibrationCompleted == False:
-                self.StatusLabelText.set('Error while calibrating.')
-                
-            self.InfoAfterCalibration()
-            self.SwitchButtonState('NORMAL')
+            self.scrollarea.print('Square Size: {} mm\n'.format(self.SquareSize))
+            self.scrollarea.print('--------------------------------------------------------------------\n')
+            self.scrollarea.print('{} CAMERA CALIBRATION\n'.format(self.Art.upper()))
+            self.scrollarea.print('--------------------------------------------------------------------\n')
+            
+            if self.Art == 'Stereo':
+                paths = (self.LeftPath, self.RightPath)
+            else:
+                paths = (self.SinglePath,)
+            settings = dict(BoardSize=self.BoardSize, Workers=self.Workers, PyramidLevel=self.PyramidLevel, CachePath=self.CachePath,
+                            SkipFailed=self.SkipFailed, MaxError=self.MaxError, MaxIterations=self.MaxIterations)
+            self.Worker = Worker()
+            thread = threading.Thread(target=self._calibration_thread, args=(self.Worker, paths, self.SquareSize, settings), daemon=True)
+            thread.start()
+            self.master.after(50, self._poll_worker)
+    
+    def CancelButton(self):
+        '''
+        Cancel Button definition
+        stops the running calibration after the current image
+        '''
+
+        if self.Worker is not None:
+            self.Worker.Cancel.set()
+            self.StatusLabelText.set('cancelling ...')
+            self.InputButtonCancel['state'] = tkinter.DISABLED
+    
+    def _calibration_thread(self, worker, paths, SquareSize, settings):
+        '''
+        runs in the background, no access to tkinter here
+        '''
+
+        LoadModules()
+        from .cal import SingleCamera, StereoCamera, CalibrationCancelled
+        start = time.perf_counter()
+        try:
+            if len(paths) == 2:
+                Params = StereoCamera(worker, paths[0], paths[1], SquareSize, RectifyMaps=self.RectifyMaps, **settings)
+            else:
+                Params = SingleCamera(worker, paths[0], SquareSize, **settings)
+        except CalibrationCancelled:
+            worker.messages.put(('cancelled',))
+            return
+        except Exception as e:
+            worker.scrollarea.print('[ERROR] {}'.format(e))
+            Params = None
+        worker.messages.put(('done', Params, time.perf_counter() - start))
+    
+    def _poll_worker(self, maxmessages=1000):
+        '''
+        drain the messages of the calibration thread
+        reschedules itself until the calibration is finished
+        '''
+
+        worker = self.Worker
+        for _ in range(maxmessages):
+            try:
+                msg = worker.messages.get_nowait()
+            except queue.Empty:
+                break
+            
+            if msg[0] == 'print':
+                self.scrollarea.print(msg[1], msg[2], format=msg[3])
+            elif msg[0] == 'progress':
+                self.ProgressBar['value'] = 100 * msg[1] / msg[2]
+                self.StatusLabelText.set('detecting corners {} / {}'.format(msg[1], msg[2]))
+            elif msg[0] == 'cancelled':
+                self.scrollarea.print('[ERROR] Calibration cancelled.')
+                self.StatusLabelText.set('Calibration cancelled.')
+                self._calibration_finished()
+                return
+            elif msg[0] == 'done':
+                self._calibration_finished(msg[1], msg[2])
+                return
+        self.master.after(50 if worker.messages.empty() else 1, self._poll_worker)
+    
+    def _calibration_finished(self, Params=None, duration=0):
+        '''
+        show the results of the calibration thread
+        '''
+
+        if Params is not None:
+            if self.Art == 'Stereo':
+                self.StereoParams = Params
+            else:
+                self.CameraParams = Params
+            self.StatusLabelText.set('Calibration done.')
+            self.CalibrationCompleted = True
+            self.ProgressBar['value'] = 100
+            
+            # measured in the thread, without the output of the console
+            self.scrollarea.print('time for calibration: {:.4f} seconds\n'.format(duration))
+            self.scrollarea.print('--------------------------------------------------------------------\n')
+            self.scrollarea.print('CALIBRATION SUCCESSFULL\n', format='success')
+            self.scrollarea.print('--------------------------------------------------------------------\n')
+            self.save_log(mode='auto')
+        elif not self.Worker.Cancel.is_set():
+            self.StatusLabelText.set('Error while calibrating.')
+        
+        self.Worker = None
+        self.InfoAfterCalibration()
+        self.SwitchButtonState('NORMAL')
     
     def SwitchButtonState(self, state):
         '''
@@ -415,11 +572,13 @@ class App():
             self.InputButtonLeft['state'] = tkinter.DISABLED
             self.InputButtonRight['state'] = tkinter.DISABLED
             self.InputButtonStart['state'] = tkinter.DISABLED
+            self.InputButtonCancel['state'] = tkinter.NORMAL
             
         if state == 'NORMAL':
             self.InputButtonLeft['state'] = tkinter.NORMAL
             self.InputButtonRight['state'] = tkinter.NORMAL
             self.InputButtonStart['state'] = tkinter.NORMAL
+            self.InputButtonCancel['state'] = tkinter.DISABLED
     
     def InfoAfterCalibration(self):
         '''
@@ -458,6 +617,8 @@ class App():
             file = '.log/log_{}.txt'.format(time.strftime('%Y%m%d_%H%M%S'))
 
         # get text from console
+        while len(self.scrollarea.buffer) > 0:
+            self.scrollarea.flush()
         txt = self.scrollarea.get('1.0', tkinter.END)
         
         # write text to file
@@ -1,8 +1,351 @@
 # IMPORTS
 import os
+import time
+import struct
+import itertools
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import cv2
 import numpy as np
 
+# INTERNAL IMPORTS
+from .cache import Cache
+from .params import Params
+from .timing import Timing, Timed
+
+# criteria for the sub pixel refinement of the corners
+CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+# decoder flags of the reductions, gray without a color buffer
+REDUCED = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+           4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+########################################################
+# Corner Detection:
+# module level function, so it can be sent to the
+# worker processes of the process pool
+########################################################
+
+def Decode(imagepath, Reduce=1):
+    '''
+    decode the image as gray image
+    Reduce 2, 4 or 8 decodes at that fraction of the size
+    '''
+
+    img = cv2.imread(imagepath, REDUCED[Reduce])
+    if img is None:
+        raise IOError('cannot read image {}'.format(imagepath))
+    return img
+
+def IsJpeg(imagepath):
+    '''
+    jpeg images are decoded at reduced size by the decoder
+    itself (scaled dct), other formats are decoded in full
+    and resized by opencv
+    '''
+
+    with open(imagepath, 'rb') as f:
+        return f.read(2) == b'\xff\xd8'
+
+def FindCorners(image, boardSize, level=0):
+    '''
+    detect the checkerboard in one image (path or gray image)
+    with level > 0 the board is found on that level of the
+    image pyramid and only refined at full resolution
+    returns the refined corners or None if not found
+    '''
+
+    return TimedCorners(image, boardSize, level)[0]
+
+def TimedCorners(image, boardSize, level=0):
+    '''
+    FindCorners with the seconds of decode, detection and subpix
+    decode is None for an already decoded image
+    returns (corners or None, times)
+    '''
+
+    start = time.perf_counter()
+    gray = image if isinstance(image, np.ndarray) else Decode(image)
+    decoded = time.perf_counter()
+    times = {'decode': decoded - start if gray is not image else None}
+    
+    # coarse detection, every level halves the image
+    small = gray
+    for _ in range(level):
+        small = cv2.pyrDown(small)
+    ret, corners = cv2.findChessboardCorners(small, boardSize)
+    detected = time.perf_counter()
+    times['detection'] = detected - decoded
+    if not ret:
+        return None, times
+    
+    # refine on the coarse level, so the scaled corners are
+    # close enough for the small window at full resolution
+    if level > 0:
+        corners = cv2.cornerSubPix(small, corners, (2,2), (-1,-1), CRITERIA)
+        corners *= 2**level
+    corners = Orientation(cv2.cornerSubPix(gray, corners, (4,4), (-1,-1), CRITERIA))
+    times['subpix'] = time.perf_counter() - detected
+    return corners, times
+
+def Orientation(corners):
+    '''
+    the detection may return the grid in reversed order,
+    depending on the image scale. the first corner is kept
+    closer to the image origin than the last, so the views
+    of a stereo pair match.
+    '''
+
+    if corners[0].sum() > corners[-1].sum():
+        return np.ascontiguousarray(corners[::-1])
+    return corners
+
+def PyramidLevel(imageSize, minSize=600):
+    '''
+    pyramid level for the coarse detection
+    the shorter image side stays at least minSize pixels
+    '''
+
+    level = 0
+    while min(imageSize[:2]) / 2**(level+1) >= minSize:
+        level += 1
+    return level
+
+########################################################
+# Video Input:
+# frames are streamed from the video file, so only a
+# few frames are in memory at a time
+########################################################
+
+# file extensions read as video
+VIDEO_TYPES = ('.avi', '.mp4', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.wmv')
+
+def IsVideo(path):
+    '''
+    check if the path is a video file
+    '''
+
+    return os.path.isfile(path) and os.path.splitext(path)[1].lower() in VIDEO_TYPES
+
+def FrameCount(path):
+    '''
+    number of frames given by the container, may be an estimate
+    '''
+
+    cap = cv2.VideoCapture(path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(count, 1)
+
+def VideoFrames(path, Step=1, Threshold=1.0, Thumbnail=64):
+    '''
+    stream the frames of a video as gray images
+    only every Step-th frame is decoded and frames nearly equal
+    to the last returned one are skipped: their mean gray value
+    difference on a Thumbnail pixel wide copy is below Threshold
+    yields (frame index, gray image)
+    '''
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError('cannot open video {}'.format(path))
+    try:
+        index = -1; last = None
+        while True:
+            # frames between the steps are not decoded
+            for _ in range(Step-1):
+                if not cap.grab():
+                    return
+                index += 1
+            ret, frame = cap.read()
+            if not ret:
+                return
+            index += 1
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            
+            # cheap difference test on a small copy
+            h, w = gray.shape
+            small = cv2.resize(gray, (Thumbnail, max(1, Thumbnail*h//w)), interpolation=cv2.INTER_AREA)
+            if last is not None and cv2.norm(small, last, cv2.NORM_L1) / small.size < Threshold:
+                continue
+            last = small
+            yield index, gray
+    finally:
+        cap.release()
+
+########################################################
+# Image Size:
+# read from the file header without decoding the pixels
+########################################################
+
+def ReadImageSize(imagepath):
+    '''
+    image size (height, width) from the header of
+    png, jpeg, bmp and tiff files, other files are decoded
+    '''
+
+    with open(imagepath, 'rb') as f:
+        head = f.read(32)
+        
+        # png: width and height in the IHDR chunk
+        if head[:8] == b'\x89PNG\r\n\x1a\n':
+            w, h = struct.unpack('>II', head[16:24])
+            return (h, w)
+        
+        # bmp: negative height for top-down images
+        if head[:2] == b'BM':
+            w, h = struct.unpack('<ii', head[18:26])
+            return (abs(h), w)
+        
+        # jpeg: search the start of frame segment, the decoder
+        # turns the image by the exif orientation before it
+        if head[:2] == b'\xff\xd8':
+            f.seek(2)
+            orientation = 1
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                if marker[1] in (0x01, 0xFF) or 0xD0 <= marker[1] <= 0xD7:
+                    f.seek(-1 if marker[1] == 0xFF else 0, 1)
+                    continue
+                length = struct.unpack('>H', f.read(2))[0]
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    h, w = struct.unpack('>xHH', f.read(5))
+                    # 5 to 8 are turned by 90 degrees
+                    return (w, h) if orientation >= 5 else (h, w)
+                if marker[1] == 0xE1:
+                    orientation = ExifOrientation(f.read(length-2)) or orientation
+                    continue
+                f.seek(length-2, 1)
+        
+        # tiff: width and height tags of the first directory
+        if head[:4] in (b'II*\x00', b'MM\x00*'):
+            e = '<' if head[:2] == b'II' else '>'
+            f.seek(struct.unpack(e+'I', head[4:8])[0])
+            n = struct.unpack(e+'H', f.read(2))[0]
+            tags = {}
+            for _ in range(n):
+                tag, typ, _, value = struct.unpack(e+'HHI4s', f.read(12))
+                if tag in (256, 257):
+                    tags[tag] = struct.unpack(e+('H' if typ == 3 else 'I'), value[:2 if typ == 3 else 4])[0]
+            if len(tags) == 2:
+                return (tags[257], tags[256])
+    
+    # unknown format, decode the whole image as the detection does
+    return tuple(Decode(imagepath).shape[:2])
+
+def ExifOrientation(data):
+    '''
+    orientation tag (1 to 8) of an exif segment or None
+    '''
+
+    if data[:6] != b'Exif\x00\x00' or len(data) < 14:
+        return None
+    tiff = data[6:]
+    e = '<' if tiff[:2] == b'II' else '>'
+    offset = struct.unpack(e+'I', tiff[4:8])[0]
+    if offset + 2 > len(tiff):
+        return None
+    n = struct.unpack(e+'H', tiff[offset:offset+2])[0]
+    for k in range(n):
+        entry = tiff[offset+2+12*k:offset+14+12*k]
+        if len(entry) < 12:
+            break
+        tag, typ = struct.unpack(e+'HH', entry[:4])
+        if tag == 0x0112 and typ == 3:
+            value = struct.unpack(e+'H', entry[8:10])[0]
+            return value if 1 <= value <= 8 else None
+    return None
+
+########################################################
+# Board Size Search:
+# the number of squares is estimated first, so the
+# matching candidates are tried before all others
+########################################################
+
+# possible board sizes (inner corners)
+SIZES = [(7,11),(6,9),(5,7),
+         (3,4),(3,5),(3,6),(3,7),(3,8),(4,5),(4,6),(4,7),(4,8),(4,9),
+         (5,6),(5,8),(5,9),(5,10),(6,7),(6,8),(6,10),(6,11),
+         (7,8),(7,9),(7,10),(7,12),(8,9),(8,10),(8,11),(8,12),(8,13),
+         (9,10),(9,11),(9,12),(9,13),(9,14),(10,11),(10,12),(10,13),(10,14),
+         (11,12),(11,13),(11,14),(12,13),(12,14),(13,14)]
+
+# a smaller size also matches a part of a larger board, but not
+# the other way round: with the most corners first, the first
+# match of an unranked search is the board itself
+LARGEST = sorted(SIZES, key=lambda s: s[0]*s[1], reverse=True)
+
+def CountSquares(gray):
+    '''
+    estimate the number of dark squares in the image
+    counts quadrangles of similar area, eroded a few
+    times to separate squares touching at the corners
+    '''
+
+    # only pixels clearly darker than their surrounding, flat
+    # regions of noise free images stay background
+    block = max(3, (min(gray.shape)//10) | 1)
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block, 5)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3,3))
+    
+    count = 0
+    for it in range(4):
+        img = cv2.erode(bw, kernel, iterations=it) if it else bw
+        # outer boundaries of all components, also of the squares
+        # inside a dark frame around the board
+        contours, hierarchy = cv2.findContours(img, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if hierarchy is None:
+            continue
+        areas = []
+        for c in [c for c, h in zip(contours, hierarchy[0]) if h[3] == -1]:
+            area = cv2.contourArea(c)
+            if area < 9:
+                continue
+            poly = cv2.approxPolyDP(c, 0.1*cv2.arcLength(c, True), True)
+            if len(poly) == 4 and cv2.isContourConvex(poly):
+                areas.append(area)
+        if len(areas) == 0:
+            continue
+        areas = np.array(areas)
+        med = np.median(areas)
+        count = max(count, int(np.sum((areas > med/2.5) & (areas < med*2.5))))
+    return count
+
+def RankSizes(count, Tolerance=False):
+    '''
+    order the possible board sizes by the difference
+    between their dark squares and the estimated count
+    with Tolerance only sizes within 10% are returned
+    '''
+
+    if count == 0:
+        return [] if Tolerance else list(SIZES)
+    diff = lambda s: abs((s[0]+1)*(s[1]+1)/2 - count)
+    ranked = sorted(SIZES, key=diff)
+    if Tolerance:
+        ranked = [s for s in ranked if diff(s) <= max(2, 0.1*count)]
+    return ranked
+
+def TrySize(gray, size):
+    '''
+    check if the board size matches the image
+    '''
+
+    ret, _ = cv2.findChessboardCorners(gray, size)
+    return ret
+
+def ObjectPoints(boardSize, SquareSize):
+    '''
+    corners of the checkerboard in board coordinates
+    '''
+
+    objp = np.zeros((boardSize[0]*boardSize[1],3), np.float32)
+    objp[:,:2] = np.mgrid[0:boardSize[0],0:boardSize[1]].T.reshape(-1,2)
+    objp *= SquareSize
+    return objp
+
 ########################################################
 # Class Images:
 # in this class we discribe the calibration images
@@ -12,23 +355,65 @@ import numpy as np
 class Images():
     '''
     load and analyze the images
+    path is a directory, a video file or a list of image files
     '''
     
-    def __init__(self, path, SquareSize):
-        self.ImageData = {}
+    def __init__(self, path, SquareSize, BoardSize=None, Workers=1, PyramidLevel=0, CachePath=None, Progress=None, SkipFailed=False,
+                 VideoStep=1, VideoThreshold=1.0):
+        self.ImageData = Params()
         self.Check = True
+        # wall and cpu time of the stages, kept in the params
+        self.Timing = Timing()
+        self.ImageData['Timing'] = self.Timing
+        # number of processes for the corner detection
+        # None or 0 uses all cores, 1 detects serial
+        self.Workers = Workers if Workers else os.cpu_count()
+        # known board size (inner corners) skips the search
+        self.BoardSize = BoardSize
+        # image pyramid level for the coarse detection
+        # 0 detects at full resolution, None picks it from the image size
+        self.PyramidLevel = PyramidLevel
+        # directory of the corner cache, None disables it
+        self.Cache = Cache(CachePath) if CachePath else None
+        # called with (done, total) after every detected image
+        self.Progress = Progress
+        # images without checkerboard are skipped instead of failing
+        self.SkipFailed = SkipFailed
+        # decode every VideoStep-th frame, skip frames with a mean
+        # difference below VideoThreshold gray values to the last one
+        self.VideoStep = VideoStep
+        self.VideoThreshold = VideoThreshold
         self.ImageData['OrdnerPfad'] = path
         self.ImageData['SquareSize'] = SquareSize
-        self.SortImageNames()
-        self.GetBoardSize()
-        self.GetChessboard()
+        # gray images decoded by the board size search
+        self.Decoded = {}
+        if not isinstance(path, (list, tuple)) and IsVideo(path):
+            self.GetVideo()
+        else:
+            self.SortImageNames()
+            if self.Cache:
+                with self.Timing.Stage('hash'):
+                    self.Hashes = self.Cache.Hash(self.ImageData['ImagePfade'], self.Workers)
+                self.Timing.Count('hash', len(self.Hashes))
+            self.GetBoardSize()
+            if not self.BoardSizeFehler:
+                self.GetChessboard()
+        self.Decoded = {}
         
+    @Timed('listing')
     def SortImageNames(self):
         '''
         read all the files in the directory
         sort by name
+        a list of image files is taken in the given order
         '''
 
+        if isinstance(self.ImageData['OrdnerPfad'], (list, tuple)):
+            self.ImageData['ImagePfade'] = list(self.ImageData['OrdnerPfad'])
+            self.ImageData['ImageNamesRaw'] = [os.path.basename(name) for name in self.ImageData['ImagePfade']]
+            self.Timing.Count('listing', len(self.ImageData['ImagePfade']))
+            return
+        
         # extract all files
         imagelist = os.listdir(self.ImageData['OrdnerPfad'])
         imagelist = sorted(imagelist)
@@ -50,54 +435,143 @@ class Images():
         
         self.ImageData['ImagePfade'] = ImageNames
         self.ImageData['ImageNamesRaw'] = ImageNamesRaw
+        self.Timing.Count('listing', len(ImageNames))
         
+    @Timed('board_size')
     def GetBoardSize(self):
         '''
-        analyze one image to detect the checkerboard size
+        analyze a few images to detect the checkerboard size
         possible from min. (3,4) to max. (13,14)
         quadratic is not possible
         '''
 
         self.BoardSizeFehler = False
-        imagepath = self.ImageData['ImagePfade'][0]
-        img = cv2.imread(imagepath)
-        
-        # convert the image to 20% of original size to save time
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        gray = cv2.resize(gray,(0,0),fx=0.2,fy=0.2) # 20%
-        
-        # possible board sizes
-        sizes = np.array([[7,11],[6,9],[5,7],
-                          [3,4],[3,5],[3,6],[3,7],[3,8],[4,5],[4,6],[4,7],[4,8],[4,9],
-                          [5,6],[5,8],[5,9],[5,10],[6,7],[6,8],[6,10],[6,11],
-                          [7,8],[7,9],[7,10],[7,12],[8,9],[8,10],[8,11],[8,12],[8,13],
-                          [9,10],[9,11],[9,12],[9,13],[9,14],[10,11],[10,12],[10,13],[10,14],
-                          [11,12],[11,13],[11,14],[12,13],[12,14],[13,14]])
-        
-        # check all sizes in the array above
-        for k in range(sizes.shape[0]):
-            size = tuple(sizes[k,:])
-            ret, _ = cv2.findChessboardCorners(gray, size)
-            if ret:
-                break
-            
-        # if not found we try the same with 50% of original size
-        if ret == False:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            gray = cv2.resize(gray,(0,0),fx=0.5,fy=0.5) # 50%
-            for k in range(sizes.shape[0]):
-                size = tuple(sizes[k,:])
-                ret, _ = cv2.findChessboardCorners(gray, size)
-                if ret:
-                    break
-                if k == (sizes.shape[0]-1):
-                    self.BoardSizeFehler = True
-                   
-        size = np.array(size)
+        paths = self.ImageData['ImagePfade']
+        
+        # vote over images spread across the set
+        samples = sorted(set([0, len(paths)//2, len(paths)-1]))
+        
+        # result of an earlier search on the same images
+        if self.Cache and self.BoardSize is None:
+            key = self.Cache.Key('BoardSize', [self.Hashes[k] for k in samples])
+            hit, data = self.Cache.Load(key)
+            if hit:
+                self.ImageData['BoardSize'] = (data[0], data[1])
+                self.ImageData['ImageSize'] = (int(data[2]), int(data[3]))
+                return
+        
+        self.ImageData['ImageSize'] = ReadImageSize(paths[0])
+        
+        # board size given by the user, no search needed
+        if self.BoardSize is not None:
+            size = np.array(self.BoardSize)
+            self.ImageData['BoardSize'] = (size.max(), size.min())
+            return
+        
+        size = self.VoteBoardSize([paths[k] for k in samples])
+        if size is None:
+            self.BoardSizeFehler = True
+            return
+        
         BoardSize = (size.max(), size.min())
         self.ImageData['BoardSize'] = BoardSize
-        self.ImageData['ImageSize'] = tuple(img.shape[:2])
+        if self.Cache:
+            self.Cache.Save(key, np.array(BoardSize + self.ImageData['ImageSize']))
+        
+    def VoteBoardSize(self, images):
+        '''
+        vote for the board size over the images (paths or gray images)
+        returns the most frequent size or None
+        '''
+
+        # search with 25% of original size to save time
+        # if not found we try the same with 50% of original size
+        workers = min(self.Workers, len(SIZES))
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for reduce in (4, 2):
+                votes = []; first = None
+                for image in images:
+                    gray = self.Reduced(image, reduce)
+                    if first is None:
+                        first = gray
+                    
+                    # only sizes close to the estimated number of squares
+                    # and sizes found before are tried
+                    ranked = RankSizes(CountSquares(gray), Tolerance=True)
+                    size = self.TrySizes(pool, gray, list(dict.fromkeys(votes + ranked)))
+                    if size is not None:
+                        votes.append(size)
+                    # stop as soon as the majority is reached
+                    top = Counter(votes).most_common(1)
+                    if top and top[0][1] > len(images)//2:
+                        break
+                
+                # no image matched, try all sizes on the first one,
+                # the count of squares is unreliable here
+                if len(votes) == 0:
+                    size = self.TrySizes(pool, first, LARGEST)
+                    if size is not None:
+                        votes.append(size)
+                if len(votes) > 0:
+                    break
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        
+        if len(votes) == 0:
+            return None
+        
+        # most frequent size, ties are won by the earlier image
+        return np.array(Counter(votes).most_common(1)[0][0])
+        
+    def Reduced(self, image, reduce):
+        '''
+        gray image (path or gray image) at 1/reduce of the size
+        jpeg files are decoded reduced, other files are decoded
+        once in full and kept for the detection
+        '''
+
+        if not isinstance(image, np.ndarray):
+            if IsJpeg(image):
+                self.Timing.Count('board_size', 1)
+                return Decode(image, reduce)
+            if image not in self.Decoded:
+                self.Decoded[image] = Decode(image)
+                self.Timing.Count('board_size', 1)
+            image = self.Decoded[image]
+        return cv2.resize(image, (0,0), fx=1/reduce, fy=1/reduce, interpolation=cv2.INTER_AREA)
+        
+    def TrySizes(self, pool, gray, candidates):
+        '''
+        try the candidates on the image in the given order
+        returns the first matching size or None
+        '''
+
+        # serial search
+        if pool is None:
+            for size in candidates:
+                if TrySize(gray, size):
+                    return size
+            return None
+        
+        # parallel search, worse ranked candidates are
+        # cancelled as soon as one candidate matched
+        futures = [pool.submit(TrySize, gray, size) for size in candidates]
+        best = len(futures)
+        for f in as_completed(futures):
+            if f.cancelled() or not f.result():
+                continue
+            r = futures.index(f)
+            if r < best:
+                best = r
+                for g in futures[r+1:]:
+                    g.cancel()
+        if best < len(futures):
+            return candidates[best]
+        return None
         
+    @Timed('chessboard')
     def GetChessboard(self):
         '''
         search for checkerboard and save points
@@ -105,27 +579,197 @@ class Images():
 
         paths = self.ImageData['ImagePfade']
         boardSize = self.ImageData['BoardSize']
-        
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+        level = self.PyramidLevel
+        if level is None:
+            level = PyramidLevel(self.ImageData['ImageSize'])
+        self.ImageData['PyramidLevel'] = level
         
         # Objectpoints 
-        objp = np.zeros((boardSize[0]*boardSize[1],3), np.float32)
-        objp[:,:2] = np.mgrid[0:boardSize[0],0:boardSize[1]].T.reshape(-1,2)
-        objp *= self.ImageData['SquareSize']
+        objp = ObjectPoints(boardSize, self.ImageData['SquareSize'])
         
-        objpoints = []; imgpoints = []
+        imgpoints = []
+        viewindex = []; failed = []
+        self.Timing.Count('chessboard', len(paths))
         
         # Imagepoints
-        for name in paths:
-            img = cv2.imread(name)
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            ret, corners = cv2.findChessboardCorners(gray, boardSize)
-            if ret:
-                objpoints.append(objp)
-                corners2 = cv2.cornerSubPix(gray, corners, (4,4), (-1,-1), criteria)
-                imgpoints.append(corners2)
+        for k, corners in enumerate(self.DetectCached(paths, boardSize, level)):
+            if corners is None:
+                if not self.SkipFailed:
+                    return None
+                failed.append(k)
             else:
-                return None
-            
-        self.ImageData['Objpoints'] = objpoints
+                imgpoints.append(corners)
+                viewindex.append(k)
+            if self.Progress:
+                self.Progress(k+1, len(paths))
+        
+        if len(imgpoints) == 0:
+            return None
+        
+        # only the views with checkerboard are kept, the index
+        # in the image set pairs the views of a stereo camera
+        names = self.ImageData['ImageNamesRaw']
+        self.ImageData['Failed'] = [names[k] for k in failed]
+        self.ImageData['ImagePfade'] = [paths[k] for k in viewindex]
+        self.ImageData['ImageNamesRaw'] = [names[k] for k in viewindex]
+        self.ImageData['ViewIndex'] = viewindex
+        # one grid for all views, the image points stacked (N, P, 2)
+        self.ImageData['Objpoints'] = objp
         self.ImageData['Imgpoints'] = imgpoints
+
+    @Timed('video')
+    def GetVideo(self):
+        '''
+        search for checkerboard in the frames of a video file
+        the frames are streamed and only the corners are kept,
+        the frame index takes the place of the image name
+        frames without checkerboard are always skipped
+        '''
+
+        path = self.ImageData['OrdnerPfad']
+        self.BoardSizeFehler = False
+        frames = VideoFrames(path, Step=self.VideoStep, Threshold=self.VideoThreshold)
+
+        # the first frames are kept for the board size search
+        head = list(itertools.islice(frames, 3))
+        if len(head) == 0:
+            self.BoardSizeFehler = True
+            return
+        self.ImageData['ImageSize'] = head[0][1].shape[:2]
+        if self.BoardSize is not None:
+            size = np.array(self.BoardSize)
+        else:
+            size = self.VoteBoardSize([gray for _, gray in head])
+            if size is None:
+                self.BoardSizeFehler = True
+                return
+        boardSize = (size.max(), size.min())
+        self.ImageData['BoardSize'] = boardSize
+
+        level = self.PyramidLevel
+        if level is None:
+            level = PyramidLevel(self.ImageData['ImageSize'])
+        self.ImageData['PyramidLevel'] = level
+        objp = ObjectPoints(boardSize, self.ImageData['SquareSize'])
+
+        imgpoints = []
+        viewindex = []; count = 0
+        total = FrameCount(path)
+        for index, corners in self.DetectFrames(itertools.chain(head, frames), boardSize, level):
+            count += 1
+            if corners is not None:
+                imgpoints.append(corners)
+                viewindex.append(index)
+            if self.Progress:
+                self.Progress(min(index+1, total), total)
+
+        if len(imgpoints) == 0:
+            return None
+
+        # frame index pairs the views of two synchronized videos
+        self.Timing.Count('video', count)
+        self.ImageData['Frames'] = count
+        self.ImageData['Failed'] = []
+        self.ImageData['ImagePfade'] = ['{}#{}'.format(path, k) for k in viewindex]
+        self.ImageData['ImageNamesRaw'] = ['frame {}'.format(k) for k in viewindex]
+        self.ImageData['ViewIndex'] = viewindex
+        # one grid for all views, the image points stacked (N, P, 2)
+        self.ImageData['Objpoints'] = objp
+        self.ImageData['Imgpoints'] = imgpoints
+
+    def DetectFrames(self, frames, boardSize, level=0):
+        '''
+        detect the corners of streamed (index, gray) frames
+        at most two frames per process are in flight, so the
+        memory stays bounded for long videos
+        yields (index, corners) in the order of the frames
+        '''
+
+        # serial detection
+        if self.Workers <= 1:
+            for index, gray in frames:
+                yield index, self.Record(TimedCorners(gray, boardSize, level))
+            return
+
+        pool = ProcessPoolExecutor(max_workers=self.Workers)
+        pending = deque()
+        try:
+            for index, gray in frames:
+                pending.append((index, pool.submit(TimedCorners, gray, boardSize, level)))
+                if len(pending) >= 2*self.Workers:
+                    index, f = pending.popleft()
+                    yield index, self.Record(f.result())
+            while pending:
+                index, f = pending.popleft()
+                yield index, self.Record(f.result())
+        finally:
+            # stop pending frames if we left early
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def DetectCached(self, paths, boardSize, level=0):
+        '''
+        take the corners from the cache where possible
+        and detect only the missing images
+        yields the results in the order of paths
+        '''
+
+        if not self.Cache:
+            yield from self.DetectAll(paths, boardSize, level)
+            return
+        
+        size = (int(boardSize[0]), int(boardSize[1]))
+        keys = [self.Cache.Key(h, size, level) for h in self.Hashes]
+        cached = [self.Cache.Load(key) for key in keys]
+        missing = [paths[i] for i in range(len(paths)) if not cached[i][0]]
+        self.ImageData['CacheHits'] = len(paths) - len(missing)
+        
+        detected = self.DetectAll(missing, boardSize, level)
+        for key, (hit, corners) in zip(keys, cached):
+            if hit:
+                # an empty array is a failed detection
+                yield corners if corners.size else None
+                continue
+            corners = next(detected)
+            self.Cache.Save(key, corners if corners is not None else np.zeros((0,1,2), np.float32))
+            yield corners
+        
+    def DetectAll(self, paths, boardSize, level=0):
+        '''
+        detect the corners of all images, images already
+        decoded by the board size search are not read again
+        yields the results in the order of paths
+        '''
+
+        rest = [name for name in paths if name not in self.Decoded]
+        workers = min(self.Workers, len(rest))
+        
+        # serial detection
+        if workers <= 1:
+            for name in paths:
+                yield self.Record(TimedCorners(self.Decoded.pop(name, name), boardSize, level))
+            return
+        
+        # parallel detection, map keeps the order of the paths
+        # and the decoded images are detected in this process meanwhile
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            chunks = max(1, len(rest) // (4*workers))
+            detected = pool.map(TimedCorners, rest, [boardSize]*len(rest), [level]*len(rest), chunksize=chunks)
+            for name in paths:
+                if name in self.Decoded:
+                    yield self.Record(TimedCorners(self.Decoded.pop(name), boardSize, level))
+                else:
+                    yield self.Record(next(detected))
+        finally:
+            # stop pending images if we left early
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def Record(self, result):
+        '''
+        keep the detection times of one image
+        returns the corners
+        '''
+
+        corners, times = result
+        self.Timing.Image(times)
+        return corners
@@ -0,0 +1,125 @@
+# IMPORTS
+import numpy as np
+
+########################################################
+# Class Params:
+# ImageData and CameraParams of one camera. the per view
+# points are stacked arrays instead of lists of small
+# arrays, all views share one object point grid
+########################################################
+
+# keys stored in the slots
+FIELDS = {'Objpoints': 'Grid', 'Imgpoints': 'Points', 'RotVektor': 'Rvecs', 'TransVektor': 'Tvecs'}
+
+# per view lists and arrays of the other keys
+VIEW_KEYS = ('ImagePfade', 'ImageNamesRaw', 'ViewIndex', 'RotMatrix', 'Extrinsics',
+             'Errors', 'Reprojectedpoints', 'Residuals')
+
+class Params():
+    '''
+    dict-style access like the former dicts:
+      Objpoints    (N, P, 3) float32, read-only view of the shared grid
+      Imgpoints    (N, P, 2) float32
+      RotVektor    (N, 3) float64
+      TransVektor  (N, 3) float64
+    all other keys are kept as given
+    '''
+
+    __slots__ = ('Grid', 'Points', 'Rvecs', 'Tvecs', 'Data')
+
+    def __init__(self, data=()):
+        self.Grid = None
+        self.Points = None
+        self.Rvecs = None
+        self.Tvecs = None
+        self.Data = {}
+        for key, value in dict(data).items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            return self.Data[key]
+        value = getattr(self, FIELDS[key])
+        if value is None:
+            raise KeyError(key)
+        if key == 'Objpoints':
+            return np.broadcast_to(value, (self.Views(),) + value.shape)
+        return value
+
+    def __setitem__(self, key, value):
+        # a single (P, 3) grid or the same grid for every view
+        if key == 'Objpoints':
+            grid = np.asarray(value, np.float32)
+            self.Grid = grid[0] if grid.ndim == 3 else grid.reshape((-1, 3))
+        elif key == 'Imgpoints':
+            points = np.asarray(value, np.float32)
+            self.Points = points.reshape((points.shape[0], -1, 2)) if points.size else np.zeros((0, 0, 2), np.float32)
+        elif key == 'RotVektor':
+            self.Rvecs = np.asarray(value, np.float64).reshape((-1, 3))
+        elif key == 'TransVektor':
+            self.Tvecs = np.asarray(value, np.float64).reshape((-1, 3))
+        else:
+            self.Data[key] = value
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        keys = [key for key, name in FIELDS.items() if getattr(self, name) is not None]
+        return keys + list(self.Data.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def pop(self, key, *default):
+        if key in FIELDS and getattr(self, FIELDS[key]) is not None:
+            value = self[key]
+            setattr(self, FIELDS[key], None)
+            return value
+        return self.Data.pop(key, *default)
+
+    def Views(self):
+        '''
+        number of views
+        '''
+
+        return 0 if self.Points is None else self.Points.shape[0]
+
+    def Take(self, positions):
+        '''
+        Params with the views at the given positions only
+        '''
+
+        positions = np.asarray(positions, int)
+        new = Params()
+        new.Grid = self.Grid
+        for name in ('Points', 'Rvecs', 'Tvecs'):
+            value = getattr(self, name)
+            setattr(new, name, None if value is None else value[positions])
+        for key, value in self.Data.items():
+            if key in VIEW_KEYS:
+                value = value[positions] if isinstance(value, np.ndarray) else [value[k] for k in positions]
+            new.Data[key] = value
+        return new
+
+    def Extend(self, other):
+        '''
+        append the views of an other Params with the same grid
+        '''
+
+        for name in ('Points', 'Rvecs', 'Tvecs'):
+            mine = getattr(self, name); theirs = getattr(other, name)
+            if mine is not None and theirs is not None:
+                setattr(self, name, np.concatenate((mine, theirs)))
+        for key in VIEW_KEYS:
+            if key in self.Data and key in other.Data:
+                if isinstance(self.Data[key], np.ndarray):
+                    self.Data[key] = np.concatenate((self.Data[key], other.Data[key]))
+                else:
+                    self.Data[key] = list(self.Data[key]) + list(other.Data[key])
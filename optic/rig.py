@@ -0,0 +1,195 @@
+# IMPORTS
+import os
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# INTERNAL IMPORTS
+from .camera import Stereo
+from .params import Params
+from .timing import Timing, Timed
+
+########################################################
+# Class Rig:
+# calibrating a rig of N cameras from the parameters of
+# the single cameras. pairs of cameras that saw the board
+# in the same views are calibrated as stereo cameras and
+# chained to transformations from the reference camera
+########################################################
+
+class Rig():
+    '''
+    Cameras: CameraParams of every camera, the views are
+             paired by their ViewIndex (same capture time)
+    Pairs:   'tree' calibrates the pairs of a spanning tree with
+             the most common views, 'all' every overlapping pair
+             and reports the loop errors of the additional pairs
+    '''
+
+    def __init__(self, Cameras, app=None, Pairs='tree', Reference=0, MinViews=3, Workers=None):
+        self.app = app
+        self.Cameras = Cameras
+        self.Pairs = Pairs
+        self.Reference = Reference
+        # common views of a pair to calibrate it
+        self.MinViews = MinViews
+        # stereoCalibrate releases the GIL, the pairs run in threads
+        # and share the detected points of the cameras
+        self.Workers = Workers if Workers else os.cpu_count()
+        self.Timing = Timing()
+        self.RigParams = {}
+        self.RigParams['Timing'] = self.Timing
+
+        self.Overlap()
+        self.Calibration()
+        self.Chain()
+        self.PrintResults()
+
+    def Overlap(self):
+        '''
+        number of common views of every pair of cameras
+        '''
+
+        N = len(self.Cameras)
+        views = [set(c['ViewIndex']) for c in self.Cameras]
+        self.Common = np.zeros((N, N), int)
+        for i in range(N):
+            for j in range(i+1, N):
+                self.Common[i, j] = self.Common[j, i] = len(views[i] & views[j])
+
+    def SpanningTree(self, weights):
+        '''
+        tree from the reference camera over the pairs with the
+        most common views (maximum spanning tree, Prim)
+        returns the edges (parent, child) in the order of the chain
+        '''
+
+        N = len(self.Cameras)
+        inside = {self.Reference}; edges = []
+        while len(inside) < N:
+            best = None
+            for i in inside:
+                for j in range(N):
+                    if j not in inside and weights[i, j] >= self.MinViews and (best is None or weights[i, j] > weights[best]):
+                        best = (i, j)
+            if best is None:
+                missing = sorted(set(range(N)) - inside)
+                raise ValueError('camera(s) {} share less than {} views with the others'.format(missing, self.MinViews))
+            edges.append(best)
+            inside.add(best[1])
+        return edges
+
+    def Pair(self, pair):
+        '''
+        stereo calibration of one pair on copies of the camera
+        parameters, the points are not copied
+        returns (Transformation, MeanError, common views)
+        '''
+
+        i, j = pair
+        St = Stereo(Params(self.Cameras[i].items()), Params(self.Cameras[j].items()))
+        return St.StereoParams['Transformation'], St.StereoParams['MeanError'], len(St.StereoParams['ViewIndex'])
+
+    @Timed('pairs')
+    def Calibration(self):
+        '''
+        calibrate the pairs at the same time
+        '''
+
+        if self.Pairs == 'all':
+            N = len(self.Cameras)
+            pairs = [(i, j) for i in range(N) for j in range(i+1, N) if self.Common[i, j] >= self.MinViews]
+        else:
+            pairs = self.SpanningTree(self.Common)
+        self.Timing.Count('pairs', len(pairs))
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.Workers, len(pairs)))) as pool:
+            results = list(pool.map(self.Pair, pairs))
+        self.Results = dict(zip(pairs, results))
+
+        self.RigParams['Pairs'] = np.array(pairs, int).reshape((-1, 2))
+        self.RigParams['PairTransformations'] = np.array([r[0] for r in results]).reshape((-1, 4, 4))
+        self.RigParams['PairErrors'] = np.array([r[1] for r in results])
+        self.RigParams['PairViews'] = np.array([r[2] for r in results], int)
+
+    def Transformation(self, i, j):
+        '''
+        transformation from camera i to camera j of a calibrated pair
+        '''
+
+        if (i, j) in self.Results:
+            return self.Results[(i, j)][0]
+        return np.linalg.inv(self.Results[(j, i)][0])
+
+    @Timed('chain')
+    def Chain(self):
+        '''
+        transformation from the reference camera to every camera
+        along the tree, the additional pairs of 'all' check it
+        '''
+
+        # tree over the calibrated pairs, most common views first
+        N = len(self.Cameras)
+        weights = np.zeros((N, N), int)
+        for (i, j), (_, _, views) in self.Results.items():
+            weights[i, j] = weights[j, i] = views
+        tree = self.SpanningTree(weights)
+
+        T = {self.Reference: np.eye(4)}
+        for i, j in tree:
+            T[j] = self.Transformation(i, j) @ T[i]
+
+        # general data without prefix, cameras with 'C0_', 'C1_', ...
+        self.RigParams['BoardSize'] = self.Cameras[0]['BoardSize']
+        self.RigParams['SquareSize'] = self.Cameras[0]['SquareSize']
+        self.RigParams['Cameras'] = N
+        self.RigParams['Reference'] = self.Reference
+        self.RigParams['Tree'] = np.array(tree, int).reshape((-1, 2))
+        for k, camera in enumerate(self.Cameras):
+            for key in camera.keys():
+                if key not in ('BoardSize', 'SquareSize'):
+                    self.RigParams['C{}_{}'.format(k, key)] = camera[key]
+            self.RigParams['C{}_Transformation'.format(k)] = T[k]
+
+        # rms of the tree pairs, weighted by their views
+        pairs = [self.Results[e] if e in self.Results else self.Results[e[::-1]] for e in tree]
+        views = np.array([p[2] for p in pairs]); errors = np.array([p[1] for p in pairs])
+        self.RigParams['MeanError'] = np.sqrt(np.sum(views*errors**2) / np.sum(views))
+
+        # difference between a direct pair and the chain: [deg, mm]
+        edges = set(tree) | set(e[::-1] for e in tree)
+        loops = [(i, j) for (i, j) in self.Results if (i, j) not in edges]
+        self.RigParams['LoopPairs'] = np.array(loops, int).reshape((-1, 2))
+        loop = np.zeros((len(loops), 2))
+        for n, (i, j) in enumerate(loops):
+            D = self.Results[(i, j)][0] @ T[i] @ np.linalg.inv(T[j])
+            loop[n] = (np.degrees(np.linalg.norm(cv2.Rodrigues(D[:3, :3])[0])), np.linalg.norm(D[:3, 3]))
+        self.RigParams['LoopErrors'] = loop
+
+    def PrintResults(self):
+        '''
+        write the results in the window
+        '''
+
+        if self.app:
+            tree = {frozenset(edge) for edge in self.RigParams['Tree'].tolist()}
+            self.app.scrollarea.print('Calibrated Pairs (camera - camera: views, error [Pixel]):')
+            for (i, j), e, v in zip(self.RigParams['Pairs'], self.RigParams['PairErrors'], self.RigParams['PairViews']):
+                used = ' (chain)' if frozenset((i, j)) in tree else ''
+                self.app.scrollarea.print('  {} - {}: {:4}  {:.5f}{}'.format(i, j, v, e, used))
+            self.app.scrollarea.print('')
+
+            for k in range(len(self.Cameras)):
+                self.app.scrollarea.print('Transformationmatrix camera {} (from camera {}):\n'.format(k, self.Reference) +
+                                          str(self.RigParams['C{}_Transformation'.format(k)]) + '\n')
+
+            if len(self.RigParams['LoopErrors']) > 0:
+                self.app.scrollarea.print('Loop Errors of the additional pairs [deg, mm]:')
+                for (i, j), (r, t) in zip(self.RigParams['LoopPairs'], self.RigParams['LoopErrors']):
+                    self.app.scrollarea.print('  {} - {}: {:.4f}  {:.3f}'.format(i, j, r, t))
+                self.app.scrollarea.print('')
+
+            self.app.scrollarea.print('Overall Mean Reprojection Error: '+str(np.round(self.RigParams['MeanError'],5))+'\n')
+
+            if self.RigParams['MeanError'] > 1:
+                self.app.scrollarea.print('Attention, Reprojection Error over 1!\n', format='warn')
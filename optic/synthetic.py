@@ -0,0 +1,249 @@
+# IMPORTS
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+# INTERNAL IMPORTS
+from .image import ObjectPoints
+from .camera import SaveParams
+
+########################################################
+# Synthetic Images:
+# checkerboard images rendered with a known camera, the
+# ground truth is saved next to the images as truth.npz
+# (same keys as a calibration result)
+########################################################
+
+def DefaultIntrinsic(imageSize):
+    '''
+    pinhole camera with about 60 degree horizontal field of view
+    '''
+
+    h, w = imageSize[:2]
+    f = 0.9 * w
+    return np.array([[f, 0, (w-1)/2], [0, f, (h-1)/2], [0, 0, 1]])
+
+def Rotation(rx, ry, rz):
+    '''
+    rotation matrix of the angles [deg] around x, y and z
+    '''
+
+    rvec = np.zeros(3)
+    R = np.eye(3)
+    for axis, angle in ((2, rz), (1, ry), (0, rx)):
+        rvec[:] = 0; rvec[axis] = np.radians(angle)
+        R = R @ cv2.Rodrigues(rvec)[0]
+    return R
+
+class Renderer():
+    '''
+    renders the board for one camera, the rays of the
+    (distorted) pixels are calculated once
+    '''
+
+    def __init__(self, K, D, imageSize, boardSize, SquareSize, pixelPerMM):
+        h, w = imageSize[:2]
+        self.ImageSize = (h, w)
+
+        # viewing ray (x, y, 1) of every pixel without distortion
+        u, v = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+        pixels = np.stack((u.ravel(), v.ravel()), axis=1).reshape((-1, 1, 2))
+        criteria = (cv2.TERM_CRITERIA_COUNT + cv2.TERM_CRITERIA_EPS, 20, 1e-6)
+        rays = cv2.undistortPointsIter(pixels, K, D, None, None, criteria).reshape((-1, 2))
+        self.Rays = np.vstack((rays.T, np.ones(rays.shape[0])))
+
+        # board texture with one white square as margin, board
+        # coordinates [mm] start at the first inner corner
+        cols, rows = boardSize[0]+1, boardSize[1]+1
+        size = int(round(SquareSize*pixelPerMM))
+        self.Scale = size / SquareSize # texture pixel per mm
+        self.Origin = -2*SquareSize
+        squares = (np.add.outer(np.arange(rows), np.arange(cols)) % 2) * 255
+        board = np.kron(squares, np.ones((size, size))).astype(np.uint8)
+        self.Texture = cv2.copyMakeBorder(board, size, size, size, size, cv2.BORDER_CONSTANT, value=255)
+
+    def __call__(self, R, t, Noise=0.0, Blur=0.0, rng=None):
+        '''
+        gray image of the board in the pose (R, t)
+        '''
+
+        # intersection of the rays with the board plane z = 0,
+        # texture pixel k covers [k, k+1) times the scale
+        H = np.column_stack((R[:, 0], R[:, 1], t))
+        q = np.linalg.solve(H, self.Rays)
+        mapx = ((q[0]/q[2] - self.Origin) * self.Scale - 0.5).reshape(self.ImageSize).astype(np.float32)
+        mapy = ((q[1]/q[2] - self.Origin) * self.Scale - 0.5).reshape(self.ImageSize).astype(np.float32)
+        img = cv2.remap(self.Texture, mapx, mapy, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=110)
+
+        # optics and sensor
+        if Blur > 0:
+            img = cv2.GaussianBlur(img, (0, 0), Blur)
+        if Noise > 0:
+            rng = rng if rng is not None else np.random.default_rng()
+            img = np.clip(img + rng.normal(0, Noise, img.shape), 0, 255).astype(np.uint8)
+        return img
+
+class Generator():
+    '''
+    synthetic calibration images of a single or stereo camera
+    Transformation (4x4) moves points from the left to the right
+    camera coordinates, None generates a single camera
+    '''
+
+    def __init__(self, BoardSize=(11,7), SquareSize=30.0, ImageSize=(576,1024), Intrinsic=None, Distortion=None,
+                 Transformation=None, RightIntrinsic=None, RightDistortion=None,
+                 MaxAngle=40.0, Coverage=(0.35, 0.8), Noise=2.0, Blur=0.7, Seed=0):
+        self.BoardSize = (max(BoardSize), min(BoardSize))
+        self.SquareSize = SquareSize
+        self.ImageSize = tuple(ImageSize[:2])
+        self.K = np.asarray(Intrinsic if Intrinsic is not None else DefaultIntrinsic(self.ImageSize), np.float64)
+        self.D = np.asarray(Distortion if Distortion is not None else (-0.2, 0.1, 0, 0, 0), np.float64).reshape((1, -1))
+        self.T = None if Transformation is None else np.asarray(Transformation, np.float64)
+        self.K2 = np.asarray(RightIntrinsic, np.float64) if RightIntrinsic is not None else self.K
+        self.D2 = np.asarray(RightDistortion, np.float64).reshape((1, -1)) if RightDistortion is not None else self.D
+        self.MaxAngle = MaxAngle # tilt of the board [deg]
+        self.Coverage = Coverage # board width relative to the image width
+        self.Noise = Noise # gaussian noise [gray values]
+        self.Blur = Blur # gaussian blur [px]
+        self.Seed = Seed
+
+    def Cameras(self):
+        '''
+        (K, D, T) of every camera, T from the left camera
+        '''
+
+        cameras = [(self.K, self.D, np.eye(4))]
+        if self.T is not None:
+            cameras.append((self.K2, self.D2, self.T))
+        return cameras
+
+    def Poses(self, Views):
+        '''
+        random board poses (board to left camera, 4x4) with the
+        whole board visible in all cameras, reproducible by Seed
+        the roll stays small, so the first corner is the one closest
+        to the image origin like in the detection
+        '''
+
+        rng = np.random.default_rng(self.Seed)
+        h, w = self.ImageSize
+        S = self.SquareSize; b0, b1 = self.BoardSize
+        center = np.array([(b0-1)*S/2, (b1-1)*S/2, 0])
+        outline = np.array([[-S, -S, 0], [b0*S, -S, 0], [b0*S, b1*S, 0], [-S, b1*S, 0]], np.float64)
+        f = self.K[0, 0]
+
+        poses = []
+        while len(poses) < Views:
+            for _ in range(1000):
+                R = Rotation(rng.uniform(-self.MaxAngle, self.MaxAngle), rng.uniform(-self.MaxAngle, self.MaxAngle), rng.uniform(-20, 20))
+                z = f * (b0+1)*S / (rng.uniform(*self.Coverage) * w)
+                C = np.array([rng.uniform(-0.4, 0.4)*w*z/f, rng.uniform(-0.4, 0.4)*h*z/f, z])
+                P = np.eye(4); P[:3, :3] = R; P[:3, 3] = C - R @ center
+                if all(self.Visible(P, K, D, T, outline) for K, D, T in self.Cameras()):
+                    poses.append(P)
+                    break
+            else:
+                raise ValueError('no pose with the whole board visible, reduce the Coverage')
+        return poses
+
+    def Visible(self, P, K, D, T, outline, margin=5):
+        Pc = T @ P
+        if np.any((Pc[:3, :3] @ outline.T)[2] + Pc[2, 3] <= 0):
+            return False
+        pts, _ = cv2.projectPoints(outline, cv2.Rodrigues(Pc[:3, :3])[0], Pc[:3, 3], K, D)
+        pts = pts.reshape((-1, 2)); h, w = self.ImageSize
+        return bool(np.all(pts >= margin) and np.all(pts[:, 0] < w-margin) and np.all(pts[:, 1] < h-margin))
+
+    def Truth(self, poses):
+        '''
+        ground truth in the keys of a calibration result
+        '''
+
+        objp = ObjectPoints(self.BoardSize, self.SquareSize)
+        truth = {'BoardSize': self.BoardSize, 'SquareSize': self.SquareSize, 'ImageSize': self.ImageSize}
+        for prefix, (K, D, T) in zip(('L_', 'R_') if self.T is not None else ('',), self.Cameras()):
+            extrinsics = np.array([T @ P for P in poses])
+            rvecs = np.array([cv2.Rodrigues(E[:3, :3])[0].ravel() for E in extrinsics])
+            imgp = [cv2.projectPoints(objp, r, E[:3, 3], K, D)[0].reshape((-1, 2)) for r, E in zip(rvecs, extrinsics)]
+            truth[prefix+'Intrinsic'] = K
+            truth[prefix+'Distortion'] = D
+            truth[prefix+'Extrinsics'] = extrinsics
+            truth[prefix+'RotVektor'] = rvecs
+            truth[prefix+'TransVektor'] = extrinsics[:, :3, 3]
+            truth[prefix+'Imgpoints'] = np.array(imgp, np.float32)
+        if self.T is not None:
+            truth['Transformation'] = self.T
+        return truth
+
+    def Generate(self, out, Views=20, Workers=None):
+        '''
+        render the images into out (left/ and right/ for a
+        stereo camera) and save the ground truth as truth.npz
+        returns the ground truth
+        '''
+
+        poses = self.Poses(Views)
+        sides = [('left', 'L'), ('right', 'R')][:len(self.Cameras())]
+        for folder, _ in sides:
+            os.makedirs(os.path.join(out, folder), exist_ok=True)
+
+        # texture resolution: about 2 texture pixels per image pixel at the nearest pose
+        zmin = min(P[2, 3] for P in poses)
+        pixelPerMM = 2 * self.K[0, 0] / zmin
+
+        jobs = [(k, side, os.path.join(out, folder, 'Im_{}_{}.png'.format(side, k+1)), P)
+                for k, P in enumerate(poses) for folder, side in sides]
+        workers = Workers if Workers else os.cpu_count()
+        config = (self, pixelPerMM)
+        if workers <= 1:
+            _InitRender(*config)
+            for job in jobs:
+                _Render(job)
+        else:
+            chunks = max(1, len(jobs) // (4*workers))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_InitRender, initargs=config) as pool:
+                list(pool.map(_Render, jobs, chunksize=chunks))
+
+        truth = self.Truth(poses)
+        SaveParams(os.path.join(out, 'truth.npz'), truth)
+        return truth
+
+# renderers of the worker process, the rays are calculated once per process
+_RENDER = None
+
+def _InitRender(generator, pixelPerMM):
+    global _RENDER
+    _RENDER = (generator, {side: Renderer(K, D, generator.ImageSize, generator.BoardSize, generator.SquareSize, pixelPerMM)
+                           for side, (K, D, T) in zip('LR', generator.Cameras())})
+
+def _Render(job):
+    k, side, file, P = job
+    generator, renderers = _RENDER
+    T = generator.Cameras()['LR'.index(side)][2]
+    Pc = T @ P
+    # noise of every image reproducible by Seed and view
+    rng = np.random.default_rng((generator.Seed, k, 'LR'.index(side)))
+    img = renderers[side](Pc[:3, :3], Pc[:3, 3], generator.Noise, generator.Blur, rng)
+    cv2.imwrite(file, img)
+
+def CompareTruth(truth, Params):
+    '''
+    differences between a calibration result and the ground truth
+    '''
+
+    result = {}
+    prefixes = ('L_', 'R_') if 'Transformation' in truth else ('',)
+    for prefix in prefixes:
+        K = np.asarray(Params[prefix+'Intrinsic']); Kt = np.asarray(truth[prefix+'Intrinsic'])
+        D = np.asarray(Params[prefix+'Distortion']).ravel(); Dt = np.asarray(truth[prefix+'Distortion']).ravel()
+        n = min(D.size, Dt.size)
+        result[prefix+'FocalError'] = float(np.max(np.abs(np.diag(K)[:2] - np.diag(Kt)[:2])))
+        result[prefix+'CenterError'] = float(np.linalg.norm(K[:2, 2] - Kt[:2, 2]))
+        result[prefix+'DistortionError'] = float(np.max(np.abs(D[:n] - Dt[:n])))
+    if 'Transformation' in truth:
+        T = np.asarray(Params['Transformation']); Tt = np.asarray(truth['Transformation'])
+        angle = np.degrees(np.linalg.norm(cv2.Rodrigues(T[:3, :3] @ Tt[:3, :3].T)[0]))
+        result['RotationError'] = float(angle)
+        result['TranslationError'] = float(np.linalg.norm(T[:3, 3] - Tt[:3, 3]))
+    return result
@@ -0,0 +1,148 @@
+# IMPORTS
+import os
+import time
+import cProfile
+import functools
+from contextlib import contextmanager
+import numpy as np
+
+########################################################
+# Class Timing:
+# wall and cpu time of the calibration stages and the
+# detection time of every image. one Timing is shared by
+# Images and Camera and stored as 'Timing' in the params
+########################################################
+
+# per image parts of the detection
+IMAGE_PARTS = ('decode', 'detection', 'subpix')
+
+def CpuTime():
+    '''
+    cpu time of this process and its finished child processes
+    (worker processes count after the pool is shut down)
+    '''
+
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+class Timing():
+    '''
+    accumulated times of the stages in the order of their first run
+    '''
+
+    def __init__(self):
+        # name -> [wall, cpu, calls, images]
+        self.Stages = {}
+        # part -> seconds of every image
+        self.Latency = {part: [] for part in IMAGE_PARTS + ('image',)}
+
+    @contextmanager
+    def Stage(self, name):
+        '''
+        time the block as stage name
+        '''
+
+        wall = time.perf_counter(); cpu = CpuTime()
+        try:
+            yield
+        finally:
+            self.Add(name, time.perf_counter() - wall, CpuTime() - cpu)
+
+    def Add(self, name, wall, cpu=0.0, calls=1):
+        stage = self.Stages.setdefault(name, [0.0, 0.0, 0, 0])
+        stage[0] += wall; stage[1] += cpu; stage[2] += calls
+
+    def Count(self, name, images):
+        '''
+        number of images (or views) handled by the stage
+        '''
+
+        self.Stages.setdefault(name, [0.0, 0.0, 0, 0])[3] += images
+
+    def Image(self, times):
+        '''
+        detection times of one image, dict of IMAGE_PARTS
+        parts without value (decoded before) are left out
+        '''
+
+        total = 0.0
+        for part in IMAGE_PARTS:
+            if times.get(part) is not None:
+                self.Latency[part].append(times[part])
+                total += times[part]
+        self.Latency['image'].append(total)
+
+    def Report(self):
+        '''
+        structured report: seconds per stage and
+        percentiles of the detection time per image
+        saving is not a stage, the report is written during it
+        '''
+
+        stages = {name: {'wall': wall, 'cpu': cpu, 'calls': calls, 'images': images}
+                  for name, (wall, cpu, calls, images) in self.Stages.items()}
+        latency = {}
+        for part, seconds in self.Latency.items():
+            if len(seconds) == 0:
+                continue
+            s = np.asarray(seconds)
+            p50, p90, p99 = np.percentile(s, (50, 90, 99))
+            latency[part] = {'count': int(s.size), 'total': float(s.sum()), 'mean': float(s.mean()),
+                             'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': float(s.max())}
+        return {'stages': stages, 'latency': latency}
+
+    def Format(self):
+        '''
+        report as text for the console
+        '''
+
+        report = self.Report()
+        lines = ['Timing [s]:          wall       cpu  calls  images']
+        for name, s in report['stages'].items():
+            lines.append('  {:<14} {:>9.4f} {:>9.4f} {:>6} {:>7}'.format(name, s['wall'], s['cpu'], s['calls'], s['images'] or ''))
+        if report['latency']:
+            lines.append('Detection per Image [ms]:   p50       p90       p99       max')
+            for part, l in report['latency'].items():
+                lines.append('  {:<14} {:>11.2f} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                    part, 1000*l['p50'], 1000*l['p90'], 1000*l['p99'], 1000*l['max']))
+        return '\n'.join(lines) + '\n'
+
+def Timed(name):
+    '''
+    decorator, times a method as stage name in self.Timing
+    '''
+
+    def decorator(method):
+        @functools.wraps(method)
+        def timed(self, *args, **kwargs):
+            with self.Timing.Stage(name):
+                return method(self, *args, **kwargs)
+        return timed
+    return decorator
+
+########################################################
+# Profiler:
+# opt-in cProfile of a block for a detailed look at the
+# hot functions, e.g.
+#   with Profiler('cal.prof'):
+#       StereoCamera(app, left, right, 30)
+# the worker processes are not profiled, use Workers=1
+########################################################
+
+@contextmanager
+def Profiler(file=None):
+    '''
+    profile the block and write the statistics to file
+    (readable with pstats), None disables the profiler
+    '''
+
+    if not file:
+        yield None
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(file)
@@ -0,0 +1,169 @@
+# IMPORTS
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# INTERNAL IMPORTS
+from .image import IsVideo, VIDEO_TYPES
+
+# file extensions read from an image directory
+IMAGE_TYPES = ('.bmp', '.jpeg', '.jpg', '.png', '.tiff', '.tif')
+
+########################################################
+# Class Undistorter:
+# undistort or rectify many images with the parameters
+# of a calibration. the remap tables are built once,
+# cv2.remap releases the GIL so the images run in threads
+########################################################
+
+class Undistorter():
+    '''
+    remap tables of one camera of a parameter file
+    Side is '' for a single camera, 'L' or 'R' for a stereo camera
+    and 'C0', 'C1', ... for a camera of a rig
+    '''
+
+    def __init__(self, Params, Side='', Crop=False):
+        self.Crop = Crop
+        prefix = Side+'_' if Side else ''
+        # the cameras of a rig may differ in size
+        h, w = np.asarray(Params[prefix+'ImageSize'] if prefix+'ImageSize' in Params else Params['ImageSize'])[:2]
+        self.ImageSize = (int(h), int(w))
+
+        # stereo camera: rectification, stored tables are used directly
+        if prefix and prefix+'Rectification' in Params:
+            self.ROI = np.asarray(Params[prefix+'RectificationROI'])
+            if prefix+'RectificationMap1' in Params:
+                self.Map1 = np.asarray(Params[prefix+'RectificationMap1'])
+                self.Map2 = np.asarray(Params[prefix+'RectificationMap2'])
+                return
+            R = Params[prefix+'Rectification']; P = Params[prefix+'Projection']
+
+        # single camera: undistortion with the optimal new intrinsics
+        else:
+            self.ROI = np.asarray(Params[prefix+'DistortionROI'])
+            R = None; P = Params[prefix+'DistortionIntrinsic']
+
+        # fixed point tables, the fastest format for cv2.remap
+        self.Map1, self.Map2 = cv2.initUndistortRectifyMap(np.asarray(Params[prefix+'Intrinsic']),
+                                                           np.asarray(Params[prefix+'Distortion']),
+                                                           R, np.asarray(P), (self.ImageSize[1], self.ImageSize[0]), cv2.CV_16SC2)
+
+    def __call__(self, image):
+        '''
+        undistorted image, cropped to the valid region if Crop
+        '''
+
+        if image.shape[:2] != self.ImageSize:
+            raise ValueError('image size {} does not match the calibration {}'.format(image.shape[:2], self.ImageSize))
+        out = cv2.remap(image, self.Map1, self.Map2, cv2.INTER_LINEAR)
+        if self.Crop:
+            x, y, w, h = [int(v) for v in self.ROI]
+            if w > 0 and h > 0:
+                out = out[y:y+h, x:x+w]
+        return out
+
+########################################################
+# Bulk Undistortion:
+# a directory or a video is processed with at most
+# 2 images per thread in memory
+########################################################
+
+def ImageFiles(path):
+    '''
+    image files of a directory sorted by name
+    '''
+
+    names = sorted(n for n in os.listdir(path) if os.path.splitext(n)[1].lower() in IMAGE_TYPES)
+    return [os.path.join(path, n) for n in names]
+
+def _ProcessFile(undistort, src, dst):
+    # read, remap and write release the GIL; any color and depth,
+    # but turned by the exif orientation as for the calibration
+    image = cv2.imread(src, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
+    if image is None:
+        raise IOError('cannot read image {}'.format(src))
+    cv2.imwrite(dst, undistort(image))
+
+def UndistortDirectory(undistort, path, out, Workers=None):
+    '''
+    undistort all images of a directory into out
+    returns the number of images
+    '''
+
+    os.makedirs(out, exist_ok=True)
+    files = ImageFiles(path)
+    workers = Workers if Workers else os.cpu_count()
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for src in files:
+            pending.append(pool.submit(_ProcessFile, undistort, src, os.path.join(out, os.path.basename(src))))
+            if len(pending) >= 2*workers:
+                pending.popleft().result()
+        while pending:
+            pending.popleft().result()
+    return len(files)
+
+def UndistortVideo(undistort, path, out, Workers=None):
+    '''
+    undistort all frames of a video, written in order to a video
+    file (if out has a video extension) or as png images into out
+    returns the number of frames
+    '''
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError('cannot open video {}'.format(path))
+    writer = None
+    if os.path.splitext(out)[1].lower() not in VIDEO_TYPES:
+        os.makedirs(out, exist_ok=True)
+
+    def Write(index, frame):
+        nonlocal writer
+        if os.path.splitext(out)[1].lower() not in VIDEO_TYPES:
+            cv2.imwrite(os.path.join(out, 'frame_{:06d}.png'.format(index)), frame)
+            return
+        if writer is None:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            fourcc = cv2.VideoWriter_fourcc(*('MJPG' if out.lower().endswith('.avi') else 'mp4v'))
+            writer = cv2.VideoWriter(out, fourcc, fps, (frame.shape[1], frame.shape[0]), frame.ndim == 3)
+        writer.write(frame)
+
+    workers = Workers if Workers else os.cpu_count()
+    pending = deque(); count = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                pending.append((count, pool.submit(undistort, frame)))
+                count += 1
+                if len(pending) >= 2*workers:
+                    index, f = pending.popleft()
+                    Write(index, f.result())
+            while pending:
+                index, f = pending.popleft()
+                Write(index, f.result())
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+    return count
+
+def Undistort(Params, source, out, Side='', Crop=False, Workers=None):
+    '''
+    undistort (or rectify) a directory or a video
+    returns (number of frames, seconds)
+    '''
+
+    start = time.perf_counter()
+    undistort = Undistorter(Params, Side=Side, Crop=Crop)
+    if IsVideo(source):
+        count = UndistortVideo(undistort, source, out, Workers)
+    else:
+        count = UndistortDirectory(undistort, source, out, Workers)
+    return count, time.perf_counter() - start
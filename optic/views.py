@@ -0,0 +1,109 @@
+# IMPORTS
+import cv2
+import numpy as np
+
+########################################################
+# Class Views:
+# select a bounded subset of informative views between
+# Images and Camera, the other views are kept for the
+# validation of the calibration
+########################################################
+
+class Views():
+    '''
+    split the views of Images.ImageData into the views used for
+    the calibration (ImageData) and held-out views (ImageData['Holdout'])
+    '''
+
+    def __init__(self, ImageData, MaxViews=80, Select=None, Grid=8):
+        self.MaxViews = MaxViews
+        self.Grid = Grid # cells per image side for the coverage
+        self.Input = ImageData
+        N = ImageData.Views()
+        if 'ViewIndex' not in ImageData:
+            ImageData['ViewIndex'] = list(range(N))
+
+        # given views (e.g. of the other stereo camera) or
+        # the most informative views
+        if Select is not None:
+            select = set(Select)
+            chosen = [k for k, v in enumerate(ImageData['ViewIndex']) if v in select]
+        elif N <= MaxViews:
+            chosen = list(range(N))
+        else:
+            chosen = self.SelectViews()
+
+        self.Split(chosen)
+
+    def Features(self):
+        '''
+        image coverage and a cheap pose of every view
+        returns coverage (N, Grid*Grid) bool, normals (N, 3), distances (N,)
+        '''
+
+        h, w = self.Input['ImageSize'][:2]
+        imgp = self.Input['Imgpoints'].astype(np.float64)
+        N = imgp.shape[0]
+
+        # cells of the image grid hit by the corners
+        cx = np.clip((imgp[:,:,0] * self.Grid / w).astype(int), 0, self.Grid-1)
+        cy = np.clip((imgp[:,:,1] * self.Grid / h).astype(int), 0, self.Grid-1)
+        coverage = np.zeros((N, self.Grid*self.Grid), bool)
+        coverage[np.repeat(np.arange(N), imgp.shape[1]), (cy*self.Grid + cx).ravel()] = True
+
+        # pose with a rough pinhole camera, enough to tell the views apart
+        f = max(w, h)
+        K = np.array([[f, 0, w/2], [0, f, h/2], [0, 0, 1]])
+        normals = np.zeros((N, 3)); distances = np.ones(N)
+        objp = self.Input['Objpoints'][0].astype(np.float64)
+        for k in range(N):
+            ok, r, t = cv2.solvePnP(objp, imgp[k], K, None, flags=cv2.SOLVEPNP_IPPE)
+            if not ok:
+                continue
+            n = cv2.Rodrigues(r)[0][:,2]
+            normals[k] = n if n[2] < 0 else -n # facing the camera
+            distances[k] = np.linalg.norm(t)
+        return coverage, normals, distances
+
+    def SelectViews(self):
+        '''
+        greedy selection: every step takes the view that adds the most
+        uncovered image cells and differs most from the chosen poses
+        '''
+
+        coverage, normals, distances = self.Features()
+        N = coverage.shape[0]
+        logdist = np.log(distances)
+
+        def PoseDistance(k):
+            # angle between the board normals plus relative distance
+            angle = np.arccos(np.clip(normals @ normals[k], -1, 1))
+            return angle + np.abs(logdist - logdist[k])
+
+        # start with the view covering most of the image
+        first = int(np.argmax(coverage.sum(axis=1)))
+        chosen = [first]
+        covered = coverage[first].copy()
+        mindist = PoseDistance(first)
+        available = np.ones(N, bool); available[first] = False
+
+        while len(chosen) < self.MaxViews:
+            gain = (coverage & ~covered).sum(axis=1) / coverage.shape[1]
+            score = np.where(available, gain + mindist, -np.inf)
+            k = int(np.argmax(score))
+            chosen.append(k)
+            available[k] = False
+            covered |= coverage[k]
+            mindist = np.minimum(mindist, PoseDistance(k))
+
+        return sorted(chosen)
+
+    def Split(self, chosen):
+        '''
+        ImageData with the chosen views and the others as Holdout
+        Holdout is None if all views are chosen
+        '''
+
+        chosen = np.isin(np.arange(self.Input.Views()), chosen)
+        self.ImageData = self.Input.Take(np.flatnonzero(chosen))
+        self.ImageData['Holdout'] = self.Input.Take(np.flatnonzero(~chosen)) if not chosen.all() else None
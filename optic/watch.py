@@ -0,0 +1,312 @@
+# IMPORTS
+import os
+import time
+import signal
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import cv2
+import numpy as np
+
+# INTERNAL IMPORTS
+from .image import Images, TimedCorners, ObjectPoints, PyramidLevel, ReadImageSize
+from .camera import Camera, Stereo
+from .params import Params
+from .timing import Timing
+from .undistort import IMAGE_TYPES
+from .cal import CheckCancel
+
+########################################################
+# Watch Mode:
+# calibration while the images are captured. new files
+# of the folders are detected in the background and
+# added to the calibration every Period seconds, so the
+# capture can stop as soon as the result converged
+########################################################
+
+class Folder():
+    '''
+    new image files of a directory, found by polling
+    the manifest keeps size and modification time of every
+    file, a file is ready when both did not change since
+    the last poll (so half written files are not read)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.Manifest = {}
+        self.Done = set()
+
+    def Poll(self):
+        '''
+        ready files not returned before, sorted by name
+        '''
+
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name in self.Done or os.path.splitext(entry.name)[1].lower() not in IMAGE_TYPES:
+                    continue
+                if entry.is_file():
+                    stat = entry.stat()
+                    current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        ready = [name for name, state in current.items() if state[0] > 0 and self.Manifest.get(name) == state]
+        ready = sorted(ready, key=lambda name: (len(name), name))
+        self.Manifest = current
+        self.Done.update(ready)
+        return [os.path.join(self.path, name) for name in ready]
+
+class Stream():
+    '''
+    views of one camera, the k-th file of the folder is view k
+    (the k-th files of a left and right folder are a pair)
+    '''
+
+    def __init__(self, path):
+        self.Folder = Folder(path)
+        # (view index, path, future of the detection) in file order
+        self.Pending = deque()
+        self.Files = 0
+        # detected views not yet in the calibration and in it
+        self.New = []
+        self.Used = []
+        self.Camera = None
+        self.Timing = Timing()
+
+    def Submit(self, pool, paths, boardSize, level):
+        for path in paths:
+            self.Pending.append((self.Files, path, pool.submit(TimedCorners, path, boardSize, level)))
+            self.Files += 1
+
+    def Collect(self, wait=False):
+        '''
+        move the finished detections in file order to New
+        '''
+
+        while self.Pending and (wait or self.Pending[0][2].done()):
+            index, path, future = self.Pending.popleft()
+            corners, times = future.result()
+            if times:
+                self.Timing.Image(times)
+            if corners is not None:
+                self.New.append((index, path, corners))
+
+    def Views(self):
+        return 0 if self.Camera is None else self.Camera.CameraParams.Views()
+
+class Watch():
+    '''
+    watch one folder (single camera) or two folders (stereo)
+    use Run() until the capture ends, then Finish() for the
+    final calibration, e.g.
+        watch = Watch(paths, 30, app)
+        try:
+            watch.Run(Idle=30)
+        except KeyboardInterrupt:
+            pass
+        Params = watch.Finish()
+    '''
+
+    def __init__(self, paths, SquareSize, app=None, BoardSize=None, Workers=None, PyramidLevel=0,
+                 Interval=1.0, Period=5.0, MinViews=5):
+        self.app = app
+        self.Streams = [Stream(path) for path in paths]
+        self.SquareSize = SquareSize
+        # known board size (inner corners), otherwise searched on the first images
+        self.BoardSize = None if BoardSize is None else (max(BoardSize), min(BoardSize))
+        self.ImageSize = None
+        # detection in the background, also with one process
+        self.Workers = max(1, Workers if Workers else os.cpu_count())
+        self.PyramidLevel = PyramidLevel
+        # seconds between two polls of the folders
+        self.Interval = Interval
+        # seconds between two calibrations
+        self.Period = Period
+        # views of every camera for the first calibration
+        self.MinViews = MinViews
+        # files found before the board size is known
+        self.Waiting = [[] for _ in self.Streams]
+        self.Pool = None
+        self.Result = None
+        self.Focal = None
+
+    def Poll(self):
+        '''
+        start the detection of the new files
+        returns the number of new files
+        '''
+
+        new = [stream.Folder.Poll() for stream in self.Streams]
+        count = sum(len(paths) for paths in new)
+        if self.ImageSize is None:
+            # files wait for the board size and image size
+            for waiting, paths in zip(self.Waiting, new):
+                waiting += paths
+            if not self.Search():
+                return count
+            new = self.Waiting
+            self.Waiting = [[] for _ in self.Streams]
+
+        if self.Pool is None:
+            self.Pool = ProcessPoolExecutor(max_workers=self.Workers, initializer=_IgnoreInterrupt)
+        level = self.PyramidLevel if self.PyramidLevel is not None else PyramidLevel(self.ImageSize)
+        for stream, paths in zip(self.Streams, new):
+            stream.Submit(self.Pool, paths, self.BoardSize, level)
+        return count
+
+    def Search(self):
+        '''
+        board size and image size from the first images,
+        the views detected by the search are kept
+        returns True if found
+        '''
+
+        # known board size, only the image size is needed
+        if self.BoardSize is not None:
+            paths = [waiting[0] for waiting in self.Waiting if waiting]
+            if paths:
+                self.ImageSize = ReadImageSize(paths[0])
+            return self.ImageSize is not None
+
+        # search on the first images of the first camera
+        stream = self.Streams[0]
+        paths = self.Waiting[0][:3]
+        if len(paths) == 0:
+            return False
+        del self.Waiting[0][:len(paths)]
+        first = Images(paths, self.SquareSize, SkipFailed=True)
+        data = first.ImageData
+        # same shape as the corners of the detection
+        found = {k: corners.reshape((-1, 1, 2)) for k, corners in zip(data.get('ViewIndex', []), data.get('Imgpoints', []))}
+        for k, path in enumerate(paths):
+            done = Future()
+            done.set_result((found.get(k), {}))
+            stream.Pending.append((stream.Files, path, done))
+            stream.Files += 1
+        if first.BoardSizeFehler:
+            return False
+        self.BoardSize = tuple(int(n) for n in data['BoardSize'])
+        self.ImageSize = tuple(int(n) for n in data['ImageSize'][:2])
+        return True
+
+    def Ready(self):
+        '''
+        new views and enough views of every camera
+        '''
+
+        if not any(stream.New for stream in self.Streams):
+            return False
+        return all(stream.Views() + len(stream.New) >= self.MinViews for stream in self.Streams)
+
+    def Calibrate(self):
+        '''
+        add the new views to the calibration of every camera
+        (starting from the previous intrinsics) and calibrate
+        the stereo camera, prints the current state
+        '''
+
+        objp = ObjectPoints(self.BoardSize, self.SquareSize)
+        for stream in self.Streams:
+            if len(stream.New) == 0:
+                continue
+            data = Params()
+            data['Objpoints'] = objp
+            data['Imgpoints'] = [corners for _, _, corners in stream.New]
+            data['ImagePfade'] = [path for _, path, _ in stream.New]
+            data['ImageNamesRaw'] = [os.path.basename(path) for _, path, _ in stream.New]
+            data['ViewIndex'] = [index for index, _, _ in stream.New]
+            data['BoardSize'] = self.BoardSize
+            data['ImageSize'] = self.ImageSize
+            data['SquareSize'] = self.SquareSize
+            data['Timing'] = stream.Timing
+            try:
+                if stream.Camera is None:
+                    stream.Camera = Camera(data)
+                else:
+                    stream.Camera.AddViews(data)
+            except (cv2.error, ValueError) as e:
+                # e.g. degenerate first views: the camera is calibrated
+                # again from all views when more views arrived
+                self.Error('Calibration of {} failed: {}'.format(stream.Folder.path, e))
+                stream.New = stream.Used + stream.New
+                stream.Used = []
+                stream.Camera = None
+                return
+            stream.Used += stream.New
+            stream.New = []
+
+        cameras = [stream.Camera.CameraParams for stream in self.Streams]
+        if len(cameras) == 1:
+            self.Result = cameras[0]
+        elif set(cameras[0]['ViewIndex']) & set(cameras[1]['ViewIndex']):
+            # Stereo takes the general data out of the camera params,
+            # the previous result is kept if it fails
+            try:
+                self.Result = Stereo(Params(cameras[0].items()), Params(cameras[1].items())).StereoParams
+            except (cv2.error, ValueError) as e:
+                self.Error('Stereo calibration failed: {}'.format(e))
+        self.Print()
+
+    def Error(self, text):
+        if self.app is not None:
+            self.app.scrollarea.print('[ERROR] {}'.format(text))
+
+    def Print(self):
+        '''
+        views, errors and the change of the focal length
+        since the last calibration
+        '''
+
+        if self.app is None:
+            return
+        cameras = [stream.Camera.CameraParams for stream in self.Streams]
+        focal = np.array([np.diag(c['Intrinsic'])[:2] for c in cameras])
+        change = '' if self.Focal is None else '  Focal Change [Pixel]: {:.3f}'.format(np.max(np.abs(focal - self.Focal)))
+        self.Focal = focal
+        text = '[{}] Views: {}  Mean Reprojection Error [Pixel]: {}'.format(time.strftime('%H:%M:%S'),
+            ' | '.join(str(c.Views()) for c in cameras), ' | '.join('{:.5f}'.format(c['MeanError']) for c in cameras))
+        if len(cameras) == 2 and self.Result is not None:
+            text += '  Stereo: {:.5f} ({} pairs)'.format(self.Result['MeanError'], len(self.Result['ViewIndex']))
+        self.app.scrollarea.print(text + change)
+
+    def Run(self, Idle=None):
+        '''
+        poll, detect and calibrate until cancelled (app.Cancel)
+        or no new file appeared for Idle seconds
+        '''
+
+        now = time.monotonic()
+        last = now; calibrated = now
+        while True:
+            CheckCancel(self.app)
+            now = time.monotonic()
+            if self.Poll():
+                last = now
+            for stream in self.Streams:
+                stream.Collect()
+            if now - calibrated >= self.Period and self.Ready():
+                self.Calibrate()
+                calibrated = now
+            pending = any(stream.Pending for stream in self.Streams)
+            if Idle is not None and now - last >= Idle and not pending:
+                return
+            time.sleep(self.Interval)
+
+    def Finish(self):
+        '''
+        wait for the running detections and calibrate the
+        remaining views, returns the parameters or None
+        '''
+
+        for stream in self.Streams:
+            stream.Collect(wait=True)
+        if self.Pool is not None:
+            self.Pool.shutdown(wait=True, cancel_futures=True)
+            self.Pool = None
+        if self.Ready():
+            self.Calibrate()
+        return self.Result
+
+def _IgnoreInterrupt():
+    # Ctrl-C stops the watch in the main process only, the
+    # workers finish the running detections for Finish()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
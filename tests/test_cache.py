@@ -0,0 +1,61 @@
+# IMPORTS
+import os
+import numpy as np
+
+# INTERNAL IMPORTS
+import optic.cache
+from optic.cache import Cache, FileHash
+
+########################################################
+# Cache:
+# detected corners are stored per image content and
+# detection parameters, broken entries are a miss
+########################################################
+
+def test_round_trip(tmp_path):
+    cache = Cache(str(tmp_path / 'cache'))
+    corners = np.random.default_rng(0).random((77, 1, 2)).astype(np.float32)
+    key = cache.Key('0123abcd', (11, 7), 0)
+    assert cache.Load(key) == (False, None)
+    cache.Save(key, corners)
+    hit, data = cache.Load(key)
+    assert hit
+    assert data.dtype == np.float32
+    assert np.array_equal(data, corners)
+    # a failed detection is stored as empty array
+    failed = cache.Key('4567efgh', (11, 7), 0)
+    cache.Save(failed, np.zeros((0,), np.float32))
+    hit, data = cache.Load(failed)
+    assert hit and data.size == 0
+    # no temporary files are left
+    assert sorted(os.listdir(tmp_path / 'cache')) == sorted([key, failed])
+
+def test_key_changes(tmp_path, monkeypatch):
+    cache = Cache(str(tmp_path))
+    key = cache.Key('0123abcd', (11, 7), 0)
+    assert key == cache.Key('0123abcd', (11, 7), 0)
+    assert key != cache.Key('0123abce', (11, 7), 0)
+    assert key != cache.Key('0123abcd', (10, 7), 0)
+    assert key != cache.Key('0123abcd', (11, 7), 1)
+    monkeypatch.setattr(optic.cache, 'CACHE_VERSION', optic.cache.CACHE_VERSION + 1)
+    assert key != cache.Key('0123abcd', (11, 7), 0)
+
+def test_broken_entry_is_miss(tmp_path):
+    cache = Cache(str(tmp_path))
+    key = cache.Key('0123abcd', (11, 7), 0)
+    cache.Save(key, np.ones((77, 1, 2), np.float32))
+    file = os.path.join(str(tmp_path), key)
+    with open(file, 'rb') as f:
+        data = f.read()
+    for broken in (data[:len(data)//2], data[:40], b'', b'no numpy file'):
+        with open(file, 'wb') as f:
+            f.write(broken)
+        assert cache.Load(key) == (False, None)
+
+def test_file_hash(tmp_path):
+    a = tmp_path / 'a.png'; b = tmp_path / 'b.png'
+    a.write_bytes(b'\x89PNG same content')
+    b.write_bytes(b'\x89PNG same content')
+    assert FileHash(str(a)) == FileHash(str(b))
+    b.write_bytes(b'\x89PNG other content')
+    assert FileHash(str(a)) != FileHash(str(b))
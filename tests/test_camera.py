@@ -0,0 +1,49 @@
+# IMPORTS
+import os
+import pytest
+
+# INTERNAL IMPORTS
+from optic.image import Images
+from optic.camera import Camera, Stereo
+from optic.params import Params
+
+########################################################
+# Incremental Views:
+# views added to the cameras in a second image set pair
+# like the views of one image set
+########################################################
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example')
+
+def ImageSet(side):
+    folder = os.path.join(EXAMPLE, 'example_{}_30mm'.format(side))
+    names = sorted(os.listdir(folder), key=lambda name: (len(name), name))
+    return [os.path.join(folder, name) for name in names]
+
+def Detect(paths):
+    return Images(paths, 30.0, BoardSize=(11, 7), CachePath=None).ImageData
+
+def test_add_views_stereo():
+    left = ImageSet('left'); right = ImageSet('right')
+    batch = Stereo(Camera(Detect(left)).CameraParams, Camera(Detect(right)).CameraParams).StereoParams
+
+    cameras = []
+    for paths in (left, right):
+        camera = Camera(Detect(paths[:12]))
+        camera.AddViews(Detect(paths[12:]))
+        assert list(camera.CameraParams['ViewIndex']) == list(range(20))
+        cameras.append(camera.CameraParams)
+    added = Stereo(*cameras).StereoParams
+
+    assert len(added['ViewIndex']) == 20
+    assert added['MeanError'] == pytest.approx(batch['MeanError'], abs=1e-3)
+
+def test_stereo_duplicate_views():
+    data = Detect(ImageSet('left')[:4])
+    cameras = []
+    for _ in range(2):
+        camera = Camera(data).CameraParams
+        camera['ViewIndex'] = [0, 1, 1, 2]
+        cameras.append(Params(camera.items()))
+    with pytest.raises(ValueError):
+        Stereo(*cameras)
@@ -0,0 +1,42 @@
+# IMPORTS
+import struct
+import cv2
+import numpy as np
+
+# INTERNAL IMPORTS
+from optic.image import ReadImageSize, Decode
+
+########################################################
+# Image Size:
+# the size from the header has to match the decoded image
+########################################################
+
+def Exif(orientation):
+    '''
+    app1 segment with the orientation tag only
+    '''
+
+    ifd = struct.pack('<H', 1) + struct.pack('<HHIHH', 0x0112, 3, 1, orientation, 0) + struct.pack('<I', 0)
+    data = b'Exif\x00\x00' + b'II*\x00' + struct.pack('<I', 8) + ifd
+    return b'\xff\xe1' + struct.pack('>H', len(data)+2) + data
+
+def WriteJpeg(path, orientation=None):
+    ok, jpeg = cv2.imencode('.jpg', np.zeros((576, 1024), np.uint8))
+    jpeg = jpeg.tobytes()
+    if orientation is not None:
+        jpeg = jpeg[:2] + Exif(orientation) + jpeg[2:]
+    with open(path, 'wb') as f:
+        f.write(jpeg)
+
+def test_jpeg_size(tmp_path):
+    path = str(tmp_path / 'plain.jpg')
+    WriteJpeg(path)
+    assert ReadImageSize(path) == (576, 1024)
+
+def test_jpeg_exif_orientation(tmp_path):
+    # 5 to 8 are turned by 90 degrees when decoded
+    for orientation, size in ((1, (576, 1024)), (3, (576, 1024)), (6, (1024, 576)), (8, (1024, 576))):
+        path = str(tmp_path / 'turned_{}.jpg'.format(orientation))
+        WriteJpeg(path, orientation)
+        assert ReadImageSize(path) == size
+        assert ReadImageSize(path) == Decode(path).shape[:2]
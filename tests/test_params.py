@@ -0,0 +1,73 @@
+# IMPORTS
+import numpy as np
+import pytest
+
+# INTERNAL IMPORTS
+from optic.params import Params
+
+########################################################
+# Params:
+# the per view keys stay aligned when views are taken
+# or appended, the grid is shared by all views
+########################################################
+
+def MakeParams(N, P=4, start=0):
+    data = Params()
+    data['Objpoints'] = np.arange(P*3, dtype=np.float32).reshape((P, 3))
+    data['Imgpoints'] = np.arange(start, start+N, dtype=np.float32)[:, None, None] * np.ones((N, P, 2), np.float32)
+    data['RotVektor'] = [np.full((3, 1), start+k, np.float64) for k in range(N)]
+    data['TransVektor'] = np.arange(start, start+N, dtype=np.float64)[:, None] * np.ones((N, 3))
+    data['ViewIndex'] = list(range(start, start+N))
+    data['ImagePfade'] = ['image_{}.png'.format(start+k) for k in range(N)]
+    data['Errors'] = np.arange(start, start+N, dtype=np.float64)
+    data['BoardSize'] = (11, 7)
+    return data
+
+def test_objpoints_broadcast():
+    data = MakeParams(5)
+    objp = data['Objpoints']
+    assert objp.shape == (5, 4, 3)
+    assert objp.dtype == np.float32
+    assert np.all(objp == objp[0])
+    # a stacked grid is stored once
+    data['Objpoints'] = np.broadcast_to(objp[0], (5, 4, 3))
+    assert data['Objpoints'].shape == (5, 4, 3)
+    assert data.Grid.shape == (4, 3)
+
+def test_take_keeps_views_aligned():
+    data = MakeParams(6)
+    part = data.Take([4, 1, 2])
+    assert part.Views() == 3
+    assert part['Objpoints'].shape == (3, 4, 3)
+    assert list(part['ViewIndex']) == [4, 1, 2]
+    assert list(part['ImagePfade']) == ['image_4.png', 'image_1.png', 'image_2.png']
+    assert list(part['Errors']) == [4, 1, 2]
+    assert part['Imgpoints'][:, 0, 0].tolist() == [4, 1, 2]
+    assert part['RotVektor'][:, 0].tolist() == [4, 1, 2]
+    assert part['TransVektor'][:, 0].tolist() == [4, 1, 2]
+    # general data is kept, the original is unchanged
+    assert part['BoardSize'] == (11, 7)
+    assert data.Views() == 6
+
+def test_take_nothing():
+    part = MakeParams(3).Take([])
+    assert part.Views() == 0
+    assert list(part['ViewIndex']) == []
+
+def test_extend_appends_views():
+    data = MakeParams(3)
+    data.Extend(MakeParams(2, start=3))
+    assert data.Views() == 5
+    assert data['Objpoints'].shape == (5, 4, 3)
+    assert list(data['ViewIndex']) == [0, 1, 2, 3, 4]
+    assert list(data['ImagePfade'])[-1] == 'image_4.png'
+    assert data['Errors'].tolist() == [0, 1, 2, 3, 4]
+    assert data['Imgpoints'][:, 0, 0].tolist() == [0, 1, 2, 3, 4]
+    assert data['RotVektor'][:, 0].tolist() == [0, 1, 2, 3, 4]
+
+def test_missing_key():
+    data = Params()
+    with pytest.raises(KeyError):
+        data['Imgpoints']
+    assert 'Imgpoints' not in data
+    assert data.get('RotVektor') is None
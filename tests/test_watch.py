@@ -0,0 +1,51 @@
+# IMPORTS
+import os
+import cv2
+
+# INTERNAL IMPORTS
+import optic.watch
+from optic.image import Images
+from optic.watch import Watch
+from optic.cal import RecordConsole
+
+########################################################
+# Watch Mode:
+# a failed calibration round keeps the views and is
+# repeated when more views arrived
+########################################################
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example', 'example_left_30mm')
+
+class RecordApp():
+    def __init__(self):
+        self.scrollarea = RecordConsole()
+
+def Views(start, stop):
+    paths = [os.path.join(EXAMPLE, 'Im_L_{}.png'.format(k+1)) for k in range(start, stop)]
+    data = Images(paths, 30.0, BoardSize=(11, 7), CachePath=None).ImageData
+    return [(start+k, paths[k], corners) for k, corners in zip(data['ViewIndex'], data['Imgpoints'])]
+
+def test_failed_round_is_repeated(monkeypatch):
+    app = RecordApp()
+    watch = Watch([EXAMPLE], 30.0, app, BoardSize=(11, 7), MinViews=5)
+    watch.ImageSize = (576, 1024)
+    stream = watch.Streams[0]
+
+    def Degenerate(data):
+        raise cv2.error('degenerate views')
+    camera = optic.watch.Camera
+    monkeypatch.setattr(optic.watch, 'Camera', Degenerate)
+    stream.New = Views(0, 6)
+    watch.Calibrate()
+    assert stream.Camera is None and watch.Result is None
+    assert len(stream.New) == 6
+    assert any(text.startswith('[ERROR]') for text, _, _ in app.scrollarea.messages)
+
+    # more views arrived, the round is repeated with all of them
+    monkeypatch.setattr(optic.watch, 'Camera', camera)
+    stream.New += Views(6, 8)
+    assert watch.Ready()
+    watch.Calibrate()
+    assert stream.Camera is not None
+    assert list(watch.Result['ViewIndex']) == list(range(8))
+    assert stream.New == []